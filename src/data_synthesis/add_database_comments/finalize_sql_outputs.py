@@ -1,6 +1,14 @@
-import json
 import argparse
 from pathlib import Path
+from typing import Iterator
+
+import orjson
+
+from jsonl_io import iter_jsonl_bytes
+
+
+# 输出缓冲区大小：累积到该字节数后再一次性写入文件
+WRITE_BUFFER_SIZE = 1 << 20
 
 
 def parse_args():
@@ -19,6 +27,35 @@ def parse_args():
     return parser.parse_args()
 
 
+def iter_records(input_path: Path) -> Iterator[dict]:
+    """流式读取 JSONL 文件中的记录，跳过空行和损坏行"""
+    for line in iter_jsonl_bytes(input_path):
+        # 空行已由 iter_jsonl_bytes 跳过，这里只需排除 "\r" 这类单字节行；
+        # 其余纯空白行交给 orjson 解析失败后跳过，不再为每行 strip 生成副本
+        if len(line) <= 1:
+            continue
+        try:
+            yield orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue  # 跳过损坏行
+
+
+def finalize_record(record: dict, fields: list[str], required_fields: frozenset,
+                    rename_from: str | None = None, rename_to: str | None = None) -> dict | None:
+    """
+    从记录中提取指定字段，并按需将 rename_from 重命名为 rename_to（rename_to 为空时不重命名，
+    否则调用方需保证 rename_from 在 fields 中）。
+    required_fields 为 fields 的 frozenset，由调用方预先构建；记录缺少任一字段时返回 None。
+    """
+    if not record.keys() >= required_fields:
+        return None
+
+    final_item = {field: record[field] for field in fields}
+    if rename_to:
+        final_item[rename_to] = final_item.pop(rename_from)
+    return final_item
+
+
 def main():
     args = parse_args()
 
@@ -30,47 +67,43 @@ def main():
     output_path = Path(args.output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 加载数据
-    records = []
-    with open(input_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue  # 跳过损坏行
-
-    print(f"共加载 {len(records)} 条后处理记录")
-
-    # 构建最终输出
-    final_records = []
+    # 流式读取、提取并写出，不在内存中保留全部记录
+    total = 0
+    success_count = 0
     missing_field_count = 0
 
-    for item in records:
-        # 检查是否包含所有指定字段
-        if not all(field in item for field in args.fields):
-            missing_field_count += 1
-            continue
-
-        # 提取指定字段
-        final_item = {field: item[field] for field in args.fields}
-
-        # 执行重命名（如果启用）
-        if args.rename_to and args.rename_from in final_item:
-            final_item[args.rename_to] = final_item.pop(args.rename_from)
-
-        final_records.append(final_item)
-
-    # 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for record in final_records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    # 所需字段集合与重命名决策只计算一次，避免在循环中逐条重复判断
+    fields = args.fields
+    required_fields = frozenset(fields)
+    rename_from = args.rename_from
+    rename_to = args.rename_to
+    if not (rename_to and rename_from in required_fields):
+        rename_to = None
+
+    buf = bytearray()
+    with open(output_path, "wb") as f:
+        for item in iter_records(input_path):
+            total += 1
+
+            # 提取指定字段并执行重命名（缺少任一字段时跳过）
+            final_item = finalize_record(item, fields, required_fields, rename_from, rename_to)
+            if final_item is None:
+                missing_field_count += 1
+                continue
+
+            buf += orjson.dumps(final_item)
+            buf += b"\n"
+            success_count += 1
+            if len(buf) > WRITE_BUFFER_SIZE:
+                f.write(buf)
+                buf.clear()
+
+        f.write(buf)
 
     # 输出统计信息（保留中文提示）
     print(f"\n✅ 最终数据生成完成！")
-    print(f"  输入记录数: {len(records)}")
-    print(f"  成功生成: {len(final_records)} 条")
+    print(f"  输入记录数: {total}")
+    print(f"  成功生成: {success_count} 条")
     if missing_field_count > 0:
         print(f"  跳过缺失字段的记录: {missing_field_count} 条")
     print(f"  结果已保存至: {output_path}")
@@ -1,10 +1,13 @@
+import hashlib
+import re
 import sqlite3
-import json
 import sys
 import argparse
 import os
 from pathlib import Path
 
+import orjson
+
 # 默认配置常量
 DEFAULT_EXCLUDED_TABLES = ["merge_metadata", "merge_conflicts"]
 DEFAULT_PROMPT_TEMPLATE_PATH = "prompts/sqlite_ddl_comment_generator_prompt.txt"
@@ -12,6 +15,26 @@ DEFAULT_PROMPT_TEMPLATE_PATH = "prompts/sqlite_ddl_comment_generator_prompt.txt"
 DEFAULT_OUTPUT_DIR = "output/prompt"
 DEFAULT_OUTPUT_FILE = os.path.join(DEFAULT_OUTPUT_DIR, "ddl_comment_prompts.jsonl")
 
+# extract_db_info 只读取数据库，连接建立后统一设置的读优化 PRAGMA
+# （只涉及当前连接，不修改数据库文件本身，如 journal_mode）
+READ_OPTIMIZED_PRAGMAS = """
+PRAGMA query_only=1;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+"""
+
+# 输出缓冲区大小：累积到该字节数后再一次性写入文件
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def quote_identifier(name: str) -> str:
+    """
+    按 SQLite 规则用双引号包裹标识符，并将名称中的双引号转义为两个双引号。
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
 def extract_db_info(
     db_path: str,
     sample_limit: int = 3,
@@ -27,7 +50,8 @@ def extract_db_info(
         sample_limit: 每个表最多提取的样本行数（默认: 3）
         include_system_tables: 是否包含 sqlite_ 开头的系统表（默认: False）
         tables_to_skip: 要跳过的表名列表（默认: DEFAULT_EXCLUDED_TABLES）
-        min_sample_rows: 表至少需包含的行数，否则被跳过（默认: 0）
+        min_sample_rows: 表至少需包含的行数，否则被跳过（默认: 0）。
+            仅当该值大于 1 时才执行 COUNT(*) 并在结果中包含 row_count 字段，否则不包含该字段
 
     返回:
         tuple: (
@@ -41,85 +65,96 @@ def extract_db_info(
     if not os.path.isfile(db_path):
         raise FileNotFoundError(f"数据库文件不存在: {db_path}")
 
-    conn = sqlite3.connect(db_path)
+    # 以只读模式（file: URI 的 mode=ro）打开，保证不会写入数据库文件；
+    # 每个表的 SQL 形状相同，放大语句缓存以复用已编译的语句
+    db_uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(db_uri, uri=True, cached_statements=512)
     cursor = conn.cursor()
 
-    # 获取表名列表
+    # 只读场景：临时数据放内存，并放大页缓存和 mmap
+    cursor.executescript(READ_OPTIMIZED_PRAGMAS)
+
+    # 一次扫描 sqlite_master，同时取得表名和建表语句
     if include_system_tables:
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table';")
     else:
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
 
-    table_names = [row[0] for row in cursor.fetchall()]
+    create_sql_by_table = dict(cursor.fetchall())
 
     processed_tables = []
     skipped_by_config = []
     skipped_for_low_row_count = []
 
-    for table_name in table_names:
+    for table_name, create_sql in create_sql_by_table.items():
         if table_name in tables_to_skip:
             skipped_by_config.append(table_name)
             continue
 
-        # 获取建表语句
-        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
-        create_sql_row = cursor.fetchone()
-        if not create_sql_row:
+        if not create_sql:
             continue
-        create_sql = create_sql_row[0]
 
-        # 获取行数
+        quoted_name = quote_identifier(table_name)
+
+        # 按阈值检查行数：COUNT(*) 需全表扫描，仅在阈值大于 1 时才真正计数
         row_count = None
         try:
-            cursor.execute(f"SELECT COUNT(*) FROM `{table_name}`;")
-            row_count = cursor.fetchone()[0]
-            if row_count < min_sample_rows:
-                skipped_for_low_row_count.append((table_name, row_count))
-                continue
+            if min_sample_rows == 1:
+                cursor.execute(f"SELECT EXISTS(SELECT 1 FROM {quoted_name} LIMIT 1);")
+                if not cursor.fetchone()[0]:
+                    skipped_for_low_row_count.append((table_name, 0))
+                    continue
+            elif min_sample_rows > 1:
+                cursor.execute(f"SELECT COUNT(*) FROM {quoted_name};")
+                row_count = cursor.fetchone()[0]
+                if row_count < min_sample_rows:
+                    skipped_for_low_row_count.append((table_name, row_count))
+                    continue
         except sqlite3.Error as e:
             print(f"警告: 无法获取表 '{table_name}' 的行数: {e}", file=sys.stderr)
 
-        # 获取列名
-        cursor.execute(f"PRAGMA table_info(`{table_name}`);")
-        columns = [col_info[1] for col_info in cursor.fetchall()]
-
-        # 获取样本数据
-        cursor.execute(f"SELECT * FROM `{table_name}` LIMIT ?;", (sample_limit,))
+        # 获取样本数据，列名取自 cursor.description，每个表只取一次
+        cursor.execute(f"SELECT * FROM {quoted_name} LIMIT ?;", (sample_limit,))
+        columns = [desc[0] for desc in cursor.description]
         rows = cursor.fetchall()
 
-        sample_data = []
-        for row in rows:
-            row_dict = {}
-            for col_name, value in zip(columns, row):
-                if isinstance(value, bytes):
-                    row_dict[col_name] = f"[BINARY_DATA:{len(value)} bytes]"
-                elif value is not None and not isinstance(value, (str, int, float, bool)):
-                    row_dict[col_name] = str(value)
-                else:
-                    row_dict[col_name] = value
-            sample_data.append(row_dict)
-
-        processed_tables.append({
+        # 按列处理：sqlite3 默认只返回 None/int/float/str/bytes，只有含二进制值的列才需要逐个替换为占位描述
+        # （SQLite 为动态类型，同一列可能混有不同类型，因此以列内是否出现 bytes 为准）
+        column_values = list(zip(*rows))
+        for i, values in enumerate(column_values):
+            if any(type(value) is bytes for value in values):
+                column_values[i] = [
+                    f"[BINARY_DATA:{len(value)} bytes]" if type(value) is bytes else value
+                    for value in values
+                ]
+        sample_data = [dict(zip(columns, row)) for row in zip(*column_values)]
+
+        table_info = {
             "table_name": table_name,
             "create_sql": create_sql,
             "sample_data": sample_data,
-            "row_count": row_count,
-        })
+        }
+        # 未统计行数（min_sample_rows <= 1）时不输出 row_count，避免写出无意义的 null
+        if row_count is not None:
+            table_info["row_count"] = row_count
+        processed_tables.append(table_info)
 
     conn.close()
     return processed_tables, skipped_by_config, skipped_for_low_row_count
 
 
+# 表名列表分隔符：逗号、分号、空白可混合使用
+_TABLE_LIST_DELIMITER_RE = re.compile(r"[,;\s]+")
+
+
 def parse_table_list(table_list_str: str) -> list[str]:
     """
-    解析命令行传入的表名列表字符串，支持逗号、分号或空格分隔。
+    解析命令行传入的表名列表字符串，支持逗号、分号或空格分隔（可混合使用）。
     """
-    if not table_list_str.strip():
+    table_list_str = table_list_str.strip()
+    if not table_list_str:
         return []
-    for delimiter in [',', ';', ' ']:
-        if delimiter in table_list_str:
-            return [t.strip() for t in table_list_str.split(delimiter) if t.strip()]
-    return [table_list_str.strip()]
+    return [t for t in _TABLE_LIST_DELIMITER_RE.split(table_list_str) if t]
 
 
 def load_prompt_template(template_path: str) -> str:
@@ -134,6 +169,26 @@ def load_prompt_template(template_path: str) -> str:
         raise RuntimeError(f"读取 prompt 模板失败: {e}")
 
 
+def build_tables_to_skip(include_merge_tables: bool, skip_tables: str) -> list[str]:
+    """
+    根据命令行参数构建最终需要跳过的表名列表。
+    """
+    tables_to_skip = [] if include_merge_tables else DEFAULT_EXCLUDED_TABLES.copy()
+    for tbl in parse_table_list(skip_tables):
+        if tbl not in tables_to_skip:
+            tables_to_skip.append(tbl)
+    return tables_to_skip
+
+
+def fill_prompt(prompt_template: str, record: dict) -> str:
+    """
+    用表的建表语句和样本数据填充 prompt 模板。
+    样本数据以紧凑 JSON 嵌入 prompt（LLM 不依赖缩进，可省去大量空白）。
+    """
+    sample_json = orjson.dumps(record["sample_data"]).decode()
+    return prompt_template.replace("{DDL_SQL}", record["create_sql"]).replace("{TABLE_DATA}", sample_json)
+
+
 def create_argument_parser() -> argparse.ArgumentParser:
     """
     创建并配置命令行参数解析器。
@@ -194,16 +249,7 @@ def main():
     args = parser.parse_args()
 
     # 构建最终的跳过表列表
-    tables_to_skip = DEFAULT_EXCLUDED_TABLES.copy()
-    if args.include_merge_tables:
-        for tbl in DEFAULT_EXCLUDED_TABLES:
-            if tbl in tables_to_skip:
-                tables_to_skip.remove(tbl)
-
-    extra_skip_tables = parse_table_list(args.skip_tables)
-    for tbl in extra_skip_tables:
-        if tbl not in tables_to_skip:
-            tables_to_skip.append(tbl)
+    tables_to_skip = build_tables_to_skip(args.include_merge_tables, args.skip_tables)
 
     print(f"数据库路径: {args.db_path}")
     print(f"样本行数上限: {args.limit}")
@@ -243,18 +289,32 @@ def main():
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
 
+    # 模板对所有记录相同，只在旁路文件中写一次，记录里仅保留其 sha256
+    template_path = Path(args.output).with_suffix(".template.txt")
+    template_sha256 = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+    try:
+        template_path.write_text(prompt_template, encoding="utf-8")
+    except Exception as e:
+        print(f"错误: 写入模板文件失败: {e}", file=sys.stderr)
+        sys.exit(1)
+
     # 写入输出文件（JSONL 格式）
     try:
-        with open(args.output, "w", encoding="utf-8") as f:
+        buf = bytearray()
+        with open(args.output, "wb") as f:
             for record in db_info:
                 record["prompt_context"] = {
-                    "template": prompt_template,
-                    "filled": prompt_template.replace("{DDL_SQL}", record["create_sql"])
-                                            .replace("{TABLE_DATA}", json.dumps(record["sample_data"], ensure_ascii=False, indent=2))
+                    "template_sha256": template_sha256,
+                    "filled": fill_prompt(prompt_template, record),
                 }
-                f.write(json.dumps(record, ensure_ascii=False))
-                f.write("\n")
+                buf += orjson.dumps(record)
+                buf += b"\n"
+                if len(buf) > WRITE_BUFFER_SIZE:
+                    f.write(buf)
+                    buf.clear()
+            f.write(buf)
         print(f"\n结果已写入: {args.output}")
+        print(f"Prompt 模板已写入: {template_path}")
     except Exception as e:
         print(f"错误: 写入输出文件失败: {e}", file=sys.stderr)
         sys.exit(1)
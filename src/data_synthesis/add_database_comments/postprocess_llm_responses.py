@@ -1,10 +1,19 @@
-import json
 import os
 import re
 import argparse
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterator
+
+import orjson
 from tqdm import tqdm
 
+from jsonl_io import iter_jsonl_bytes
+
+
+# 输出缓冲区大小：累积到该字节数后再一次性写入文件
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def parse_args():
     """解析命令行参数"""
@@ -18,6 +27,12 @@ def parse_args():
     return parser.parse_args()
 
 
+@lru_cache(maxsize=8)
+def _sql_code_block_re(language: str) -> re.Pattern:
+    """按语言标记缓存编译好的代码块正则：匹配带语言标记或无标记的代码块"""
+    return re.compile(rf"```(?:{re.escape(language)}\s*)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+
+
 def extract_sql_from_response(content: str, language: str = "sql") -> str | None:
     """
     从 LLM 响应中提取第一个指定语言的代码块内容。
@@ -26,40 +41,66 @@ def extract_sql_from_response(content: str, language: str = "sql") -> str | None
       - 无语言标记的代码块：``` ... ```
       - 自动跳过 <think>...</think> 或 </think> 后的内容
     """
-    # 移除思考部分（兼容不同格式）
-    if "</think>" in content:
-        content = re.search(r"</think>(.*?)$", content, re.DOTALL).group(1).strip()
+    # 跳过思考部分（兼容不同格式）：从最后一个 </think> 之后开始匹配，不复制子串
+    start = content.rfind("</think>")
+    start = 0 if start == -1 else start + len("</think>")
 
-    # 构造正则：匹配带语言标记或无标记的代码块
-    pattern = rf"```(?:{re.escape(language)}\s*)?\s*(.*?)\s*```"
-    match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
+    # 正则两侧的 \s* 已吸收首尾空白，捕获组无需再 strip
+    match = _sql_code_block_re(language).search(content, start)
     if match:
-        return match.group(1).strip()
+        return match.group(1)
 
     # 作为备选：如果整个响应看起来像纯 SQL（无 markdown），可尝试直接返回
     # （谨慎启用，此处暂不启用，避免误提取）
     return None
 
 
-def load_all_responses(input_dir: str) -> list:
-    """递归加载 input_dir 下所有 .jsonl 文件中的响应记录"""
-    responses = []
+def extract_sql_from_record(record: dict, language: str = "sql") -> dict | None:
+    """
+    从单条 LLM 响应记录的 generated_content 中提取 SQL，写入 extracted_sql 字段后返回该记录。
+    响应为空或无法解析时返回 None。
+    """
+    content = record.get("generated_content", "")
+    if not content:
+        return None
+
+    extracted_sql = extract_sql_from_response(content, language)
+    if extracted_sql is None:
+        return None
+
+    # 将提取的 SQL 存入新字段（语义化命名）
+    record["extracted_sql"] = extracted_sql
+    return record
+
+
+def _walk_jsonl(root: str) -> Iterator[str]:
+    """基于 os.scandir 递归遍历目录，按文件名后缀筛选 .jsonl 文件（利用目录项自带的类型信息，免去逐项 stat）"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".jsonl"):
+                    yield entry.path
+
+
+def iter_responses(input_dir: str) -> Iterator[dict]:
+    """递归流式读取 input_dir 下所有 .jsonl 文件中的响应记录（逐条 yield，不整体加载到内存）"""
     input_path = Path(input_dir)
     if not input_path.exists():
         raise FileNotFoundError(f"输入目录不存在: {input_dir}")
 
-    for file_path in input_path.rglob("*.jsonl"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                    responses.append(data)
-                except json.JSONDecodeError:
-                    continue  # 跳过损坏行
-    return responses
+    for file_path in _walk_jsonl(str(input_path)):
+        for line in iter_jsonl_bytes(file_path):
+            # 空行已由 iter_jsonl_bytes 跳过，这里只需排除 "\r" 这类单字节行；
+            # 其余纯空白行交给 orjson 解析失败后跳过，不再为每行 strip 生成副本
+            if len(line) <= 1:
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # 跳过损坏行
 
 
 def main():
@@ -69,39 +110,33 @@ def main():
     output_path = Path(args.output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 1. 加载所有原始响应
-    print(f"正在从 '{args.input_dir}' 加载 LLM 响应...")
-    raw_responses = load_all_responses(args.input_dir)
-    print(f"共加载 {len(raw_responses)} 条原始响应")
-
-    # 2. 提取并过滤 SQL
-    processed_responses = []
+    # 1. 流式读取原始响应，边提取 SQL 边写出结果
+    print(f"正在从 '{args.input_dir}' 读取 LLM 响应...")
+    total = 0
+    success_count = 0
     failed_count = 0
 
-    for record in tqdm(raw_responses, desc="解析 SQL 中"):
-        content = record.get("generated_content", "")
-        if not content:
-            failed_count += 1
-            continue
-
-        extracted_sql = extract_sql_from_response(content, args.code_block_language)
-
-        if extracted_sql is None:
-            failed_count += 1
-            continue
-
-        # 将提取的 SQL 存入新字段（语义化命名）
-        record["extracted_sql"] = extracted_sql
-        processed_responses.append(record)
-
-    # 3. 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for data in processed_responses:
-            f.write(json.dumps(data, ensure_ascii=False) + "\n")
-
-    # 4. 输出统计信息（保留中文提示）
-    success_count = len(processed_responses)
-    total = len(raw_responses)
+    buf = bytearray()
+    with open(output_path, "wb") as f:
+        # 记录量大时降低进度条刷新频率，避免逐条更新的开销
+        for record in tqdm(iter_responses(args.input_dir), desc="解析 SQL 中",
+                           mininterval=0.5, miniters=1000, unit="rec"):
+            total += 1
+            record = extract_sql_from_record(record, args.code_block_language)
+            if record is None:
+                failed_count += 1
+                continue
+
+            buf += orjson.dumps(record)
+            buf += b"\n"
+            success_count += 1
+            if len(buf) > WRITE_BUFFER_SIZE:
+                f.write(buf)
+                buf.clear()
+
+        f.write(buf)
+
+    # 2. 输出统计信息（保留中文提示）
     print(f"\n✅ 处理完成！")
     print(f"  总响应数: {total}")
     print(f"  成功提取 SQL: {success_count}")
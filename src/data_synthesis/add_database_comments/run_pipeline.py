@@ -0,0 +1,175 @@
+import sys
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+
+import orjson
+from openai import OpenAI
+from tqdm import tqdm
+
+from generate_ddl_comment_prompts import (
+    DEFAULT_PROMPT_TEMPLATE_PATH,
+    WRITE_BUFFER_SIZE,
+    build_tables_to_skip,
+    extract_db_info,
+    fill_prompt,
+    load_prompt_template,
+)
+from generate_llm_responses import process_single_prompt
+from postprocess_llm_responses import extract_sql_from_record
+from finalize_sql_outputs import finalize_record
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="一次性完成 DDL 注释流水线：提取表结构 → 调用 LLM → 提取 SQL → 生成最终结果，中间结果不落盘"
+    )
+    # 提取表结构与 prompt（同 generate_ddl_comment_prompts.py）
+    parser.add_argument("--db-path", default="../database_merge/report/merged_cspider.sqlite",
+                        help="SQLite 数据库文件路径")
+    parser.add_argument("--limit", type=int, default=3,
+                        help="每个表最多提取的样本行数（默认: 3）")
+    parser.add_argument("--min-rows", type=int, default=1,
+                        help="表至少需包含的行数才被处理（默认: 1）")
+    parser.add_argument("--include-system", action="store_true",
+                        help="包含 sqlite_ 开头的系统表")
+    parser.add_argument("--skip-tables", type=str, default="",
+                        help='额外跳过的表名，支持逗号、分号或空格分隔，例如: "log, temp_data"')
+    parser.add_argument("--include-merge-tables", action="store_true",
+                        help="包含默认跳过的 merge 相关表（merge_metadata, merge_conflicts）")
+    parser.add_argument("--prompt-template", type=str, default=DEFAULT_PROMPT_TEMPLATE_PATH,
+                        help=f"Prompt 模板路径（默认: {DEFAULT_PROMPT_TEMPLATE_PATH}）")
+    # 调用 LLM（同 generate_llm_responses.py）
+    parser.add_argument("--model_name", type=str, default="Qwen3-30B-A3B",
+                        help="要调用的模型名称")
+    parser.add_argument("--base_url", type=str, default="http://localhost:8000/v1",
+                        help="OpenAI 兼容 API 的 base URL")
+    parser.add_argument("--api_key", type=str, default="",
+                        help="API 密钥（本地部署通常为空）")
+    parser.add_argument("--max_workers", type=int, default=10,
+                        help="并发线程数")
+    parser.add_argument("--timeout", type=int, default=120,
+                        help="单个请求的超时时间（秒）")
+    parser.add_argument("--enable_thinking", action="store_true",
+                        help="启用思考模式（仅对支持 think 的模型有效）")
+    # 提取 SQL 与最终字段（同 postprocess_llm_responses.py / finalize_sql_outputs.py）
+    parser.add_argument("--code_block_language", type=str, default="sql",
+                        help="期望的代码块语言标记，如 'sql'（匹配 ```sql ... ```）")
+    parser.add_argument("--fields", nargs="+", default=["table_name", "create_sql", "sample_data", "extracted_sql"],
+                        help="需要保留的字段列表")
+    parser.add_argument("--rename_from", type=str, default="extracted_sql",
+                        help="要重命名的源字段名（若该字段在 --fields 中，则会被重命名）")
+    parser.add_argument("--rename_to", type=str, default="annotated_ddl",
+                        help="重命名后的目标字段名（设为空字符串 '' 可禁用重命名）")
+    parser.add_argument("--output_file", type=str, default="output/final/annotated_ddl.jsonl",
+                        help="最终输出文件路径")
+    return parser.parse_args()
+
+
+def main():
+    """
+    将四个步骤串成一个流式流水线：每个表的记录在内存中依次经过 prompt 填充、LLM 调用、
+    SQL 提取和字段整理，只写出最终结果，省去中间 JSONL 的序列化与解析。
+    注意：该流水线不支持断点续跑，需要断点续跑时请按 README 分步执行各脚本。
+    """
+    args = parse_args()
+
+    tables_to_skip = build_tables_to_skip(args.include_merge_tables, args.skip_tables)
+    try:
+        db_info, _, _ = extract_db_info(
+            db_path=args.db_path,
+            sample_limit=args.limit,
+            include_system_tables=args.include_system,
+            tables_to_skip=tables_to_skip,
+            min_sample_rows=args.min_rows,
+        )
+        prompt_template = load_prompt_template(args.prompt_template)
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"待处理的表数量: {len(db_info)}")
+
+    output_path = Path(args.output_file)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 所需字段集合与重命名决策只计算一次
+    fields = args.fields
+    required_fields = frozenset(fields)
+    rename_from = args.rename_from
+    rename_to = args.rename_to
+    if not (rename_to and rename_from in required_fields):
+        rename_to = None
+
+    client = OpenAI(base_url=args.base_url, api_key=args.api_key)
+
+    success_count = 0
+    llm_failed_count = 0
+    parse_failed_count = 0
+    missing_field_count = 0
+
+    buf = bytearray()
+    # 在途请求数上限：只保持少量任务在排队，避免一次性为全部表创建 Future 和 prompt
+    max_in_flight = 2 * args.max_workers
+    pending = enumerate(db_info)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor, open(output_path, "wb") as f, \
+            tqdm(total=len(db_info), desc="流水线处理中") as pbar:
+        while True:
+            # 补充任务，使在途请求数回到上限
+            for idx, record in islice(pending, max_in_flight - len(in_flight)):
+                future = executor.submit(
+                    process_single_prompt,
+                    client, args.model_name, fill_prompt(prompt_template, record), idx, args.timeout,
+                    args.enable_thinking
+                )
+                in_flight[future] = record
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = in_flight.pop(future)
+                pbar.update(1)
+                _, generated_content = future.result()
+
+                # 跳过明显错误的结果（与 generate_llm_responses.py 的判断一致）
+                if isinstance(generated_content, str) and "error" in generated_content.lower():
+                    llm_failed_count += 1
+                    continue
+
+                record["model_name"] = args.model_name
+                record["generated_content"] = generated_content
+
+                record = extract_sql_from_record(record, args.code_block_language)
+                if record is None:
+                    parse_failed_count += 1
+                    continue
+
+                final_item = finalize_record(record, fields, required_fields, rename_from, rename_to)
+                if final_item is None:
+                    missing_field_count += 1
+                    continue
+
+                buf += orjson.dumps(final_item)
+                buf += b"\n"
+                success_count += 1
+                if len(buf) > WRITE_BUFFER_SIZE:
+                    f.write(buf)
+                    buf.clear()
+
+        f.write(buf)
+
+    print(f"\n✅ 流水线处理完成！")
+    print(f"  表数量: {len(db_info)}")
+    print(f"  成功生成: {success_count} 条")
+    print(f"  LLM 调用失败: {llm_failed_count} 条")
+    print(f"  无法解析 SQL: {parse_failed_count} 条")
+    if missing_field_count > 0:
+        print(f"  跳过缺失字段的记录: {missing_field_count} 条")
+    print(f"  结果已保存至: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,33 @@ Schema文件分析工具
 通过分析schema.sql文件来统计每个数据库的表数量
 """
 
+import mmap
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
+# 空白或SQL注释（-- 行注释、/* 块注释 */），可出现在DDL关键字之间
+_SQL_GAP = r'(?:\s|--[^\n]*(?:\n|$)|/\*.*?\*/)'
+# 标识符的各种写法："name"、`name`、[name] 或不带引号的 name
+_SQL_IDENT = r'(?:"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|([^\s(."`\[]+))'
+
+# 匹配 CREATE [TEMP] TABLE [IF NOT EXISTS] [schema.]table_name ( ...（模块加载时编译一次）
+# 编译为 bytes 正则，直接在内存映射的文件内容上匹配，无需整体解码。
+# 注释、字符串和带引号的标识符作为整体先行匹配并被跳过（不捕获任何分组），
+# 因此被注释掉的 /* CREATE TABLE fake(x) */ 或字符串里的 CREATE TABLE 不会被计入
+_TABLE_RE = re.compile(
+    (
+        r"--[^\n]*|/\*.*?(?:\*/|$)|'(?:[^']|'')*'|\"[^\"]*\"|`[^`]*`|"
+        rf'CREATE{_SQL_GAP}+(?:TEMP(?:ORARY)?{_SQL_GAP}+)?TABLE{_SQL_GAP}+'
+        rf'(?:IF{_SQL_GAP}+NOT{_SQL_GAP}+EXISTS{_SQL_GAP}+)?'
+        rf'(?:(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[^\s(."`\[]+){_SQL_GAP}*\.{_SQL_GAP}*)?'
+        rf'{_SQL_IDENT}{_SQL_GAP}*\('
+    ).encode(),
+    re.IGNORECASE | re.DOTALL
+)
+
 def parse_schema_sql(schema_path):
     """
     解析schema.sql文件，提取表信息
@@ -20,19 +43,19 @@ def parse_schema_sql(schema_path):
         dict: 包含表信息的字典
     """
     try:
-        with open(schema_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # 使用正则表达式匹配CREATE TABLE语句
-        # 匹配CREATE TABLE "table_name" 或 CREATE TABLE table_name
-        table_pattern = r'CREATE\s+TABLE\s+(?:"([^"]+)"|(\S+))\s*\('
-        matches = re.findall(table_pattern, content, re.IGNORECASE)
-
-        # 提取表名（处理引号）
-        tables = []
-        for match in matches:
-            table_name = match[0] if match[0] else match[1]
-            tables.append(table_name)
+        # 内存映射文件，正则直接在 bytes 上匹配，避免读入并解码整个文件（空文件无法映射）
+        with open(schema_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                matched = []
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # 逐个匹配CREATE TABLE语句并提取表名（四种标识符写法中只有一组会命中；
+                    # 注释和字符串的匹配没有命中任何分组，直接丢弃）
+                    matched = [name for m in _TABLE_RE.finditer(mm)
+                               if (name := next(filter(None, m.groups()), None)) is not None]
+
+        # 只解码匹配到的表名
+        tables = [name.decode('utf-8', 'replace') for name in matched]
 
         return {
             'table_count': len(tables),
@@ -48,9 +71,27 @@ def parse_schema_sql(schema_path):
             'error': str(e)
         }
 
+def _analyze_one_schema(schema_file, base_path):
+    """
+    分析单个schema.sql文件（在进程池的工作进程中执行）
+
+    Args:
+        schema_file (Path): schema.sql文件路径
+        base_path (Path): 基础路径
+
+    Returns:
+        tuple: (相对路径, 分析结果字典)
+    """
+    relative_path = str(schema_file.relative_to(base_path))
+    return relative_path, {
+        'database_name': schema_file.parent.name,
+        'full_path': str(schema_file),
+        'analysis': parse_schema_sql(schema_file)
+    }
+
 def analyze_all_schemas(base_path):
     """
-    分析所有schema.sql文件
+    分析所有schema.sql文件（使用进程池并行解析）
 
     Args:
         base_path (str): 基础路径
@@ -70,29 +111,22 @@ def analyze_all_schemas(base_path):
 
     print(f"找到 {total_files} 个schema.sql文件\n")
 
-    for i, schema_file in enumerate(schema_files, 1):
-        print(f"[{i:3d}/{total_files}] 分析: {schema_file.relative_to(base_path)}")
+    # 各文件相互独立，分发到进程池解析，结果按原顺序在主进程中汇总输出
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        outcomes = executor.map(_analyze_one_schema, schema_files, repeat(base_path), chunksize=8)
 
-        # 获取数据库名称
-        db_name = schema_file.parent.name
-        relative_path = str(schema_file.relative_to(base_path))
+        for i, (relative_path, result) in enumerate(outcomes, 1):
+            print(f"[{i:3d}/{total_files}] 分析: {relative_path}")
+            results[relative_path] = result
 
-        # 解析schema
-        analysis = parse_schema_sql(schema_file)
-
-        results[relative_path] = {
-            'database_name': db_name,
-            'full_path': str(schema_file),
-            'analysis': analysis
-        }
-
-        if analysis['status'] == 'success':
-            print(f"       表数量: {analysis['table_count']}")
-            if analysis['table_names']:
-                print(f"       表名称: {', '.join(analysis['table_names'])}")
-        else:
-            print(f"       错误: {analysis['error']}")
-        print()
+            analysis = result['analysis']
+            if analysis['status'] == 'success':
+                print(f"       表数量: {analysis['table_count']}")
+                if analysis['table_names']:
+                    print(f"       表名称: {', '.join(analysis['table_names'])}")
+            else:
+                print(f"       错误: {analysis['error']}")
+            print()
 
     return results
 
@@ -107,9 +141,25 @@ def generate_summary_report(results):
     print("汇总报告")
     print("=" * 80)
 
+    # 单次遍历同时统计成功数、总表数、表数量分布以及表最多/最少的数据库
     total_databases = len(results)
-    successful_databases = sum(1 for r in results.values() if r['analysis']['status'] == 'success')
-    total_tables = sum(r['analysis']['table_count'] for r in results.values() if r['analysis']['status'] == 'success')
+    successful_databases = 0
+    total_tables = 0
+    table_counts = {}
+    max_db = min_db = None
+    max_count, min_count = -1, float('inf')
+    for db_info in results.values():
+        analysis = db_info['analysis']
+        if analysis['status'] != 'success':
+            continue
+        successful_databases += 1
+        count = analysis['table_count']
+        total_tables += count
+        table_counts[count] = table_counts.get(count, 0) + 1
+        if count > max_count:
+            max_count, max_db = count, db_info
+        if count < min_count:
+            min_count, min_db = count, db_info
 
     print(f"总数据库数量: {total_databases}")
     print(f"成功分析的数据库: {successful_databases}")
@@ -117,13 +167,6 @@ def generate_summary_report(results):
     print(f"平均每数据库表数量: {total_tables / successful_databases:.2f}" if successful_databases > 0 else "N/A")
     print()
 
-    # 统计表数量分布
-    table_counts = {}
-    for db_info in results.values():
-        if db_info['analysis']['status'] == 'success':
-            count = db_info['analysis']['table_count']
-            table_counts[count] = table_counts.get(count, 0) + 1
-
     print("表数量分布:")
     for count in sorted(table_counts.keys()):
         print(f"  {count}个表: {table_counts[count]}个数据库")
@@ -131,9 +174,6 @@ def generate_summary_report(results):
 
     # 找出表最多和最少的数据库
     if successful_databases > 0:
-        max_db = max(results.values(), key=lambda x: x['analysis']['table_count'] if x['analysis']['status'] == 'success' else -1)
-        min_db = min(results.values(), key=lambda x: x['analysis']['table_count'] if x['analysis']['status'] == 'success' else float('inf'))
-
         print(f"表最多的数据库: {max_db['database_name']} ({max_db['analysis']['table_count']}个表)")
         print(f"表最少的数据库: {min_db['database_name']} ({min_db['analysis']['table_count']}个表)")
 
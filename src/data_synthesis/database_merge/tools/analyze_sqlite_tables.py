@@ -7,6 +7,8 @@ SQLite数据库表数量分析工具
 
 import sqlite3
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 import json
 
@@ -63,9 +65,27 @@ def analyze_sqlite_database(db_path):
             'error': str(e)
         }
 
+def _analyze_one_sqlite(db_file, base_path):
+    """
+    分析单个SQLite数据库文件（在进程池的工作进程中执行，每个进程使用自己的连接）
+
+    Args:
+        db_file (Path): SQLite数据库文件路径
+        base_path (Path): 基础路径
+
+    Returns:
+        tuple: (相对路径, 分析结果字典)
+    """
+    relative_path = str(db_file.relative_to(base_path))
+    return relative_path, {
+        'database_name': db_file.parent.name,
+        'full_path': str(db_file),
+        'analysis': analyze_sqlite_database(db_file)
+    }
+
 def scan_sqlite_databases(base_path):
     """
-    扫描指定路径下的所有SQLite数据库
+    扫描指定路径下的所有SQLite数据库（使用进程池并行分析）
 
     Args:
         base_path (str): 基础路径
@@ -85,29 +105,22 @@ def scan_sqlite_databases(base_path):
 
     print(f"找到 {total_files} 个SQLite数据库文件\n")
 
-    for i, db_file in enumerate(sqlite_files, 1):
-        print(f"[{i:3d}/{total_files}] 分析: {db_file.relative_to(base_path)}")
-
-        # 获取相对路径作为键
-        relative_path = str(db_file.relative_to(base_path))
-        db_name = db_file.parent.name
-
-        # 分析数据库
-        analysis = analyze_sqlite_database(db_file)
+    # 各数据库相互独立，分发到进程池分析，结果按原顺序在主进程中汇总输出
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        outcomes = executor.map(_analyze_one_sqlite, sqlite_files, repeat(base_path), chunksize=8)
 
-        results[relative_path] = {
-            'database_name': db_name,
-            'full_path': str(db_file),
-            'analysis': analysis
-        }
+        for i, (relative_path, result) in enumerate(outcomes, 1):
+            print(f"[{i:3d}/{total_files}] 分析: {relative_path}")
+            results[relative_path] = result
 
-        if analysis['status'] == 'success':
-            print(f"       表数量: {analysis['table_count']}")
-            if analysis['table_names']:
-                print(f"       表名称: {', '.join(analysis['table_names'])}")
-        else:
-            print(f"       错误: {analysis['error']}")
-        print()
+            analysis = result['analysis']
+            if analysis['status'] == 'success':
+                print(f"       表数量: {analysis['table_count']}")
+                if analysis['table_names']:
+                    print(f"       表名称: {', '.join(analysis['table_names'])}")
+            else:
+                print(f"       错误: {analysis['error']}")
+            print()
 
     return results
 
@@ -122,9 +135,25 @@ def generate_summary_report(results):
     print("汇总报告")
     print("=" * 80)
 
+    # 单次遍历同时统计成功数、总表数、表数量分布以及表最多/最少的数据库
     total_databases = len(results)
-    successful_databases = sum(1 for r in results.values() if r['analysis']['status'] == 'success')
-    total_tables = sum(r['analysis']['table_count'] for r in results.values() if r['analysis']['status'] == 'success')
+    successful_databases = 0
+    total_tables = 0
+    table_counts = {}
+    max_db = min_db = None
+    max_count, min_count = -1, float('inf')
+    for db_info in results.values():
+        analysis = db_info['analysis']
+        if analysis['status'] != 'success':
+            continue
+        successful_databases += 1
+        count = analysis['table_count']
+        total_tables += count
+        table_counts[count] = table_counts.get(count, 0) + 1
+        if count > max_count:
+            max_count, max_db = count, db_info
+        if count < min_count:
+            min_count, min_db = count, db_info
 
     print(f"总数据库数量: {total_databases}")
     print(f"成功分析的数据库: {successful_databases}")
@@ -132,13 +161,6 @@ def generate_summary_report(results):
     print(f"平均每数据库表数量: {total_tables / successful_databases:.2f}" if successful_databases > 0 else "N/A")
     print()
 
-    # 统计表数量分布
-    table_counts = {}
-    for db_info in results.values():
-        if db_info['analysis']['status'] == 'success':
-            count = db_info['analysis']['table_count']
-            table_counts[count] = table_counts.get(count, 0) + 1
-
     print("表数量分布:")
     for count in sorted(table_counts.keys()):
         print(f"  {count}个表: {table_counts[count]}个数据库")
@@ -146,9 +168,6 @@ def generate_summary_report(results):
 
     # 找出表最多和最少的数据库
     if successful_databases > 0:
-        max_db = max(results.values(), key=lambda x: x['analysis']['table_count'] if x['analysis']['status'] == 'success' else -1)
-        min_db = min(results.values(), key=lambda x: x['analysis']['table_count'] if x['analysis']['status'] == 'success' else float('inf'))
-
         print(f"表最多的数据库: {max_db['database_name']} ({max_db['analysis']['table_count']}个表)")
         print(f"表最少的数据库: {min_db['database_name']} ({min_db['analysis']['table_count']}个表)")
 
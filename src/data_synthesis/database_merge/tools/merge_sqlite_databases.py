@@ -8,7 +8,11 @@ SQLite数据库合并工具
 
 import sqlite3
 import os
+import re
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 from pathlib import Path
 import hashlib
 import json
@@ -16,14 +20,175 @@ from datetime import datetime
 import argparse
 
 
+def quote_identifier(name):
+    """按 SQLite 规则用双引号包裹标识符，并将名称中的双引号转义为两个双引号"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+# 标识符的各种写法："name"（内部双引号写作 ""）、`name`、[name] 或不带引号的 name
+_SQL_IDENT = r'(?:"(?:[^"]|"")+"|`[^`]+`|\[[^\]]+\]|[^\s(.,"`\[]+)'
+
+# CREATE TABLE 语句开头的 [IF NOT EXISTS] [schema.]table_name 部分
+_CREATE_TABLE_NAME_RE = re.compile(
+    rf'^(\s*CREATE\s+TABLE\s+)(?:IF\s+NOT\s+EXISTS\s+)?(?:{_SQL_IDENT}\s*\.\s*)?{_SQL_IDENT}',
+    re.IGNORECASE
+)
+
+# CREATE INDEX 语句开头的 [IF NOT EXISTS] [schema.]index_name ON table_name 部分
+_CREATE_INDEX_RE = re.compile(
+    rf'^(\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+)(?:IF\s+NOT\s+EXISTS\s+)?(?:{_SQL_IDENT}\s*\.\s*)?'
+    rf'{_SQL_IDENT}(\s+ON\s+){_SQL_IDENT}',
+    re.IGNORECASE
+)
+
+# 外键子句中被引用的表名：REFERENCES table_name
+_REFERENCES_RE = re.compile(rf'(\bREFERENCES\s+)({_SQL_IDENT})', re.IGNORECASE)
+
+
+def unquote_identifier(ident):
+    """去掉标识符两侧的引号（"name"、`name`、[name]），并还原转义的双引号"""
+    if ident[:1] == '"' and ident[-1:] == '"':
+        return ident[1:-1].replace('""', '"')
+    if ident[:1] in ('`', '[') and len(ident) >= 2:
+        return ident[1:-1]
+    return ident
+
+
+def rewrite_create_table_sql(create_sql, new_table_name, name_mapping):
+    """
+    基于源数据库 sqlite_master 中的原始建表语句生成新表的建表语句：
+    将表名替换为 new_table_name，并把外键引用的表名改为其在合并库中的新名称，
+    从而完整保留列类型、默认值、复合主键、外键等约束。
+    name_mapping 为源数据库中 小写表名 -> 合并库表名 的映射。
+    """
+    create_sql = _CREATE_TABLE_NAME_RE.sub(
+        lambda m: m.group(1) + quote_identifier(new_table_name), create_sql, count=1
+    )
+
+    def _rewrite_reference(match):
+        referenced = unquote_identifier(match.group(2))
+        new_name = name_mapping.get(referenced.lower())
+        if new_name is None or new_name == referenced:
+            return match.group(0)
+        return match.group(1) + quote_identifier(new_name)
+
+    return _REFERENCES_RE.sub(_rewrite_reference, create_sql)
+
+
+def rewrite_create_index_sql(index_sql, new_index_name, new_table_name):
+    """将源数据库的 CREATE INDEX 语句改写为使用合并库中的索引名和表名"""
+    return _CREATE_INDEX_RE.sub(
+        lambda m: m.group(1) + quote_identifier(new_index_name) + m.group(2) + quote_identifier(new_table_name),
+        index_sql, count=1
+    )
+
+
+def read_database_schema(db_path):
+    """读取源数据库的完整结构（表结构、外键、索引），出错时抛出异常"""
+    with closing(sqlite3.connect(db_path)) as conn:
+        return _query_database_schema(conn.cursor())
+
+
+def _query_database_schema(cursor):
+    """在已打开的源数据库上查询表结构、外键和索引信息"""
+    schema_info = {
+        'tables': {},
+        'create_sql': {},
+        'foreign_keys': {},
+        'indexes': {},
+        'index_sql': []
+    }
+
+    # 获取原始建表语句（sqlite_sequence 等 sqlite_ 内部表由 SQLite 自动维护，
+    # 读取结构时即排除，整库复制和逐表复制两条路径处理的表保持一致；LIKE 中的 _ 需转义）
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite!_%' ESCAPE '!'"
+    )
+    schema_info['create_sql'] = dict(cursor.fetchall())
+
+    # 用 pragma_* 表值函数一次查询取得所有表的结构，代替逐表执行 PRAGMA
+    cursor.execute("""
+        SELECT m.name, p.*
+        FROM sqlite_master AS m, pragma_table_info(m.name) AS p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite!_%' ESCAPE '!'
+    """)
+    for table, *column in cursor.fetchall():
+        schema_info['tables'].setdefault(table, []).append(tuple(column))
+
+    # 获取外键信息
+    cursor.execute("""
+        SELECT m.name, p.*
+        FROM sqlite_master AS m, pragma_foreign_key_list(m.name) AS p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite!_%' ESCAPE '!'
+    """)
+    for table, *foreign_key in cursor.fetchall():
+        schema_info['foreign_keys'].setdefault(table, []).append(tuple(foreign_key))
+
+    # 获取索引信息
+    cursor.execute("""
+        SELECT m.name, p.*
+        FROM sqlite_master AS m, pragma_index_list(m.name) AS p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite!_%' ESCAPE '!'
+    """)
+    for table, *index in cursor.fetchall():
+        schema_info['indexes'].setdefault(table, []).append(tuple(index))
+
+    # 显式创建的索引（自动索引的 sql 为 NULL，随建表语句中的约束一起重建）
+    cursor.execute("""
+        SELECT tbl_name, name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name NOT LIKE 'sqlite!_%' ESCAPE '!'
+    """)
+    schema_info['index_sql'] = cursor.fetchall()
+
+    return schema_info
+
+
+def find_sqlite_files(base_path):
+    """
+    用 os.scandir 递归查找 base_path 下所有 .sqlite 文件，按文件大小升序返回路径列表
+    （小库先合并，大小相同时按路径排序，保证合并顺序稳定）
+    """
+    found = []
+    pending = [str(base_path)]
+    while pending:
+        with os.scandir(pending.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.endswith('.sqlite') and entry.is_file():
+                    found.append((entry.stat().st_size, entry.path))
+    found.sort()
+    return [path for _, path in found]
+
+
+def _read_schema_for_pool(db_path):
+    """供进程池调用：读取数据库结构，出错时返回 None 而不是抛出异常"""
+    try:
+        return read_database_schema(db_path)
+    except Exception:
+        return None
+
+
 class SQLiteMerger:
-    def __init__(self, output_db, log_file, table_prefix_max_len=50, enable_foreign_keys=True):
+    def __init__(self, output_db, log_file, table_prefix_max_len=50, enable_foreign_keys=True,
+                 journal_mode='WAL', synchronous='NORMAL', cache_size_kib=65536,
+                 mmap_size=268435456, page_size=8192, max_workers=None):
         self.output_db = output_db
         self.log_file = log_file
         self.table_prefix_max_len = table_prefix_max_len
         self.enable_foreign_keys = enable_foreign_keys
+        # 输出数据库的写优化 PRAGMA（WAL 模式下 synchronous=NORMAL 仍可保证数据库一致性）
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.page_size = page_size
+        # 并行读取源数据库结构的进程数（默认: CPU 核数）
+        self.max_workers = max_workers or os.cpu_count()
         self.conn = None
         self.cursor = None
+        self.existing_tables = set()  # 输出库中已存在的表名（小写，SQLite 表名不区分大小写）
+        self.existing_indexes = set()  # 输出库中已存在的索引名（小写，索引名在整个库内唯一且不区分大小写）
         self.table_mapping = {}  # 数据库名 -> 表名映射
         self.conflict_resolution = {}  # 冲突解决记录
         self.stats = {
@@ -35,6 +200,13 @@ class SQLiteMerger:
             'conflicts': 0
         }
 
+        # 日志文件在合并器生命周期内只打开一次，由 close() 负责刷新并关闭
+        try:
+            self._log_fh = open(self.log_file, 'a', encoding='utf-8', buffering=1 << 16)
+        except Exception as e:
+            self._log_fh = None
+            print(f"打开日志文件失败: {e}")
+
     def log(self, message):
         """记录日志"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -42,11 +214,12 @@ class SQLiteMerger:
         print(log_message)
 
         # 写入日志文件
-        try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_message + '\n')
-        except Exception as e:
-            print(f"写入日志文件失败: {e}")
+        if self._log_fh is not None:
+            try:
+                self._log_fh.write(log_message)
+                self._log_fh.write('\n')
+            except Exception as e:
+                print(f"写入日志文件失败: {e}")
 
     def initialize_output_database(self):
         """初始化输出数据库"""
@@ -55,14 +228,26 @@ class SQLiteMerger:
             if os.path.exists(self.output_db):
                 os.remove(self.output_db)
                 self.log(f"删除已存在的输出文件: {self.output_db}")
+            # 同时清理上次运行残留的 WAL/共享内存文件，避免被新数据库误用
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(self.output_db + suffix):
+                    os.remove(self.output_db + suffix)
 
             # 创建新的数据库连接
             self.conn = sqlite3.connect(self.output_db)
             self.cursor = self.conn.cursor()
 
-            # 启用外键约束
-            if self.enable_foreign_keys:
-                self.cursor.execute("PRAGMA foreign_keys = ON")
+            # 设置写优化 PRAGMA；page_size 必须在建表和切换 WAL 之前设置才会生效
+            self.cursor.execute(f"PRAGMA page_size = {int(self.page_size)}")
+            self.cursor.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            self.cursor.execute(f"PRAGMA synchronous = {self.synchronous}")
+            self.cursor.execute("PRAGMA temp_store = MEMORY")
+            self.cursor.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)}")
+            self.cursor.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+
+            # 批量导入期间显式关闭外键约束（部分 SQLite 编译版本默认开启），避免逐行检查；
+            # 导入期间子表也可能先于父表写入。全部导入后再统一检查（见 merge_all_databases）
+            self.cursor.execute("PRAGMA foreign_keys = OFF")
 
             # 创建元数据表来记录合并信息
             self.cursor.execute("""
@@ -91,6 +276,9 @@ class SQLiteMerger:
             """)
 
             self.conn.commit()
+
+            # 输出库中已存在的表名（统一小写），在内存中维护，建表成功后随之更新
+            self.existing_tables = {'merge_metadata', 'merge_conflicts'}
             self.log("输出数据库初始化成功")
             return True
 
@@ -101,46 +289,13 @@ class SQLiteMerger:
     def get_database_schema(self, db_path):
         """获取数据库的完整结构"""
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            schema_info = {
-                'tables': {},
-                'foreign_keys': {},
-                'indexes': {}
-            }
-
-            # 获取所有表
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cursor.fetchall()]
-
-            for table in tables:
-                # 获取表结构
-                cursor.execute(f"PRAGMA table_info({table})")
-                columns = cursor.fetchall()
-                schema_info['tables'][table] = columns
-
-                # 获取外键信息
-                cursor.execute(f"PRAGMA foreign_key_list({table})")
-                foreign_keys = cursor.fetchall()
-                if foreign_keys:
-                    schema_info['foreign_keys'][table] = foreign_keys
-
-                # 获取索引信息
-                cursor.execute(f"PRAGMA index_list({table})")
-                indexes = cursor.fetchall()
-                if indexes:
-                    schema_info['indexes'][table] = indexes
-
-            conn.close()
-            return schema_info
-
+            return read_database_schema(db_path)
         except Exception as e:
             self.log(f"获取数据库结构失败 {db_path}: {e}")
             return None
 
     def resolve_table_name_conflict(self, original_table, db_name, existing_tables):
-        """解决表名冲突"""
+        """解决表名冲突（existing_tables 为小写表名集合，按不区分大小写判断唯一性）"""
         # 策略：在表名前添加数据库名前缀
         base_name = f"{db_name}_{original_table}"
 
@@ -153,49 +308,17 @@ class SQLiteMerger:
         # 确保唯一性
         final_name = base_name
         counter = 1
-        while final_name in existing_tables:
+        while final_name.lower() in existing_tables:
             final_name = f"{base_name}_{counter}"
             counter += 1
 
         return final_name
 
-    def create_table_with_prefix(self, original_schema, new_table_name):
-        """创建新表，保持原有结构"""
+    def create_table_with_prefix(self, create_sql, original_table, new_table_name, name_mapping):
+        """基于源表的原始建表语句创建新表，保持原有结构（列定义、主键、外键等约束）"""
         try:
-            # 重建CREATE TABLE语句
-            columns = []
-            primary_keys = []
-            foreign_keys = []
-
-            for col in original_schema:
-                col_name = col[1]
-                col_type = col[2]
-                not_null = "NOT NULL" if col[3] else ""
-                default_val = f"DEFAULT {col[4]}" if col[4] is not None else ""
-                is_pk = "PRIMARY KEY" if col[5] else ""
-
-                col_def = f'"{col_name}" {col_type} {not_null} {default_val} {is_pk}'
-                columns.append(col_def.strip())
-
-                if col[5]:  # 如果是主键
-                    primary_keys.append(col_name)
-
-            create_sql = f"""
-                CREATE TABLE "{new_table_name}" (
-                    {', '.join(columns)}
-                )
-            """
-
-            self.cursor.execute(create_sql)
-
-            # 记录冲突解决
-            self.conflict_resolution[new_table_name] = {
-                'original_table': original_schema[0][1] if original_schema else 'unknown',
-                'resolution_method': 'prefix_with_db_name'
-            }
-
-            self.stats['conflicts'] += 1
-            self.log(f"创建表: {new_table_name}")
+            self.cursor.execute(rewrite_create_table_sql(create_sql, new_table_name, name_mapping))
+            self._record_created_table(original_table, new_table_name)
 
             return True
 
@@ -203,43 +326,110 @@ class SQLiteMerger:
             self.log(f"创建表失败 {new_table_name}: {e}")
             return False
 
-    def copy_table_data(self, source_db, source_table, target_table):
-        """复制表数据，处理主键冲突"""
-        try:
-            source_conn = sqlite3.connect(source_db)
-            source_cursor = source_conn.cursor()
+    def _record_created_table(self, original_table, new_table_name):
+        """记录新建的表及其冲突解决信息"""
+        self.conflict_resolution[new_table_name] = {
+            'original_table': original_table,
+            'resolution_method': 'prefix_with_db_name'
+        }
 
-            # 获取源表数据
-            source_cursor.execute(f"SELECT * FROM {source_table}")
-            rows = source_cursor.fetchall()
+        self.existing_tables.add(new_table_name.lower())
+        self.stats['conflicts'] += 1
+        self.log(f"创建表: {new_table_name}")
+
+    def create_indexes(self, index_sql, table_names, db_name):
+        """
+        在数据全部导入并提交后，重建源数据库中显式创建的索引（一个事务内完成），
+        避免导入期间每插入一行都要维护索引 B 树。
+        index_sql 为 (源表名, 索引名, CREATE INDEX 语句) 列表，table_names 为 源表名 -> 合并库表名 的映射，
+        只为成功创建的表重建索引；索引名冲突时加数据库名前缀。
+        """
+        pending = [item for item in index_sql if item[0] in table_names]
+        if not pending:
+            return
 
-            # 获取列数
-            source_cursor.execute(f"PRAGMA table_info({source_table})")
-            columns = source_cursor.fetchall()
-            column_count = len(columns)
+        start_time = time.perf_counter()
+        created_count = 0
+        self.conn.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        for original_table, index_name, sql in pending:
+            new_index_name = index_name
+            counter = 1
+            while new_index_name.lower() in self.existing_indexes:
+                new_index_name = f"{db_name}_{index_name}" if counter == 1 else f"{db_name}_{index_name}_{counter}"
+                counter += 1
+            try:
+                # 单条语句失败只回滚该语句，不影响同一事务中的其他索引
+                self.cursor.execute(rewrite_create_index_sql(sql, new_index_name, table_names[original_table]))
+            except sqlite3.Error as e:
+                # 例如导入时跳过约束检查后数据不满足 UNIQUE 索引，数据保持原样
+                self.log(f"创建索引失败 {new_index_name}: {e}")
+                continue
+            self.existing_indexes.add(new_index_name.lower())
+            created_count += 1
+        self.conn.commit()
+
+        self.log(f"索引创建完成: {db_name} ({created_count}/{len(pending)} 个, "
+                f"耗时 {time.perf_counter() - start_time:.2f} 秒)")
+
+    def copy_database_in_one_transaction(self, table_names, create_sql_map, name_mapping):
+        """
+        无表名冲突时的快速路径（源数据库需已 ATTACH 为 src）：
+        在同一个事务中完成该源数据库所有表的建表和整表复制，只提交一次。
+        返回 {原表名: 复制行数}；任一步失败则整体回滚并返回 None，由调用方退回逐表处理。
+        """
+        self.conn.commit()
+        row_counts = {}
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            for original_table, new_table_name in table_names.items():
+                self.cursor.execute(
+                    rewrite_create_table_sql(create_sql_map[original_table], new_table_name, name_mapping)
+                )
+                self.cursor.execute(
+                    f"INSERT INTO {quote_identifier(new_table_name)} "
+                    f"SELECT * FROM src.{quote_identifier(original_table)}"
+                )
+                row_counts[original_table] = self.cursor.rowcount
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            self.log(f"整库复制失败，改为逐表复制: {e}")
+            return None
 
-            if not rows:
-                source_conn.close()
-                return 0
+        for original_table in row_counts:
+            new_table_name = table_names[original_table]
+            self._record_created_table(original_table, new_table_name)
+            self.log(f"数据复制完成: {original_table} -> {new_table_name} "
+                    f"(插入: {row_counts[original_table]}, 跳过: 0)")
+        return row_counts
 
-            # 准备插入语句（使用列名占位符）
-            placeholders = ', '.join(['?'] * column_count)
-            insert_sql = f'INSERT INTO "{target_table}" VALUES ({placeholders})'
+    def copy_table_data(self, source_table, target_table):
+        """复制表数据（源数据库需已 ATTACH 为 src），处理主键冲突"""
+        try:
+            # 由 SQLite 在引擎内部完成整表复制，数据不再经过 Python
+            source_ref = f"src.{quote_identifier(source_table)}"
+            target_ref = quote_identifier(target_table)
 
             inserted_count = 0
             skipped_count = 0
 
-            for row in rows:
-                try:
-                    self.cursor.execute(insert_sql, row)
-                    inserted_count += 1
-                except sqlite3.IntegrityError as e:
-                    # 处理主键重复或其他完整性错误
-                    skipped_count += 1
-                    if skipped_count <= 5:  # 只记录前5个错误
-                        self.log(f"跳过重复数据: {target_table} - {str(e)}")
-
-            source_conn.close()
+            # 整张表的插入放在一个事务中，避免逐行提交；先提交此前未完成的隐式事务
+            self.conn.commit()
+            try:
+                self.cursor.execute("BEGIN IMMEDIATE")
+                self.cursor.execute(f"INSERT INTO {target_ref} SELECT * FROM {source_ref}")
+                inserted_count = self.cursor.rowcount
+            except sqlite3.IntegrityError as e:
+                # 整表插入遇到完整性错误：回滚后改用 INSERT OR IGNORE，跳过主键重复等冲突行
+                self.conn.rollback()
+                self.log(f"跳过重复数据: {target_table} - {str(e)}")
+                self.cursor.execute("BEGIN IMMEDIATE")
+                self.cursor.execute(f"INSERT OR IGNORE INTO {target_ref} SELECT * FROM {source_ref}")
+                inserted_count = self.cursor.rowcount
+                self.cursor.execute(f"SELECT COUNT(*) FROM {source_ref}")
+                skipped_count = self.cursor.fetchone()[0] - inserted_count
+            self.conn.commit()
 
             self.log(f"数据复制完成: {source_table} -> {target_table} "
                     f"(插入: {inserted_count}, 跳过: {skipped_count})")
@@ -247,55 +437,93 @@ class SQLiteMerger:
             return inserted_count
 
         except Exception as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
             self.log(f"复制数据失败 {source_table} -> {target_table}: {e}")
             return 0
 
-    def merge_single_database(self, db_path):
-        """合并单个数据库"""
+    def merge_single_database(self, db_path, schema=None):
+        """合并单个数据库（schema 为预先读取的数据库结构，未提供时在此读取）"""
         try:
             db_name = Path(db_path).parent.name
             self.log(f"开始合并数据库: {db_name}")
 
             # 获取数据库结构
-            schema = self.get_database_schema(db_path)
+            if schema is None:
+                schema = self.get_database_schema(db_path)
             if not schema:
                 self.stats['failed_merges'] += 1
                 return False
 
-            # 获取已存在的表名
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            existing_tables = {row[0] for row in self.cursor.fetchall()}
-
             # 合并每个表
             db_table_count = 0
             db_row_count = 0
 
-            for original_table in schema['tables']:
-                # 解决表名冲突
-                if original_table in existing_tables:
-                    new_table_name = self.resolve_table_name_conflict(
-                        original_table, db_name, existing_tables
+            # 源数据库整体 ATTACH 为 src，各表在引擎内部直接复制（ATTACH/DETACH 需在事务外执行）
+            self.conn.commit()
+            self.cursor.execute("ATTACH DATABASE ? AS src", (db_path,))
+            meta_rows = []
+            try:
+                # 先为该源数据库的所有表确定合并后的表名，以便建表时同步改写外键引用
+                # （SQLite 表名不区分大小写，冲突按小写表名判断）
+                planned_tables = set(self.existing_tables)
+                table_names = {}
+                for original_table in schema['tables']:
+                    # 解决表名冲突
+                    if original_table.lower() in planned_tables:
+                        new_table_name = self.resolve_table_name_conflict(
+                            original_table, db_name, planned_tables
+                        )
+                        self.log(f"表名冲突: {original_table} -> {new_table_name}")
+                    else:
+                        new_table_name = original_table
+                    planned_tables.add(new_table_name.lower())
+                    table_names[original_table] = new_table_name
+                # 外键引用按小写表名匹配
+                name_mapping = {name.lower(): new_name for name, new_name in table_names.items()}
+
+                # 没有任何表需要改名时，整库的建表和复制放在一个事务中完成
+                row_counts = None
+                if all(original == new for original, new in table_names.items()):
+                    row_counts = self.copy_database_in_one_transaction(
+                        table_names, schema['create_sql'], name_mapping
                     )
-                    self.log(f"表名冲突: {original_table} -> {new_table_name}")
-                else:
-                    new_table_name = original_table
+                if row_counts is not None:
+                    for original_table, row_count in row_counts.items():
+                        meta_rows.append((db_name, original_table, table_names[original_table], row_count))
+                        db_table_count += 1
+                        db_row_count += row_count
+                    table_names = {}
+
+                for original_table, new_table_name in table_names.items():
+                    # 创建表
+                    create_sql = schema['create_sql'][original_table]
+                    if not self.create_table_with_prefix(create_sql, original_table, new_table_name, name_mapping):
+                        # 同库其他表的外键子句已指向该名称，保留该名称，避免之后被其他数据库的同名表占用
+                        self.existing_tables.add(new_table_name.lower())
+                        continue
 
-                # 创建表
-                table_schema = schema['tables'][original_table]
-                if self.create_table_with_prefix(table_schema, new_table_name):
                     # 复制数据
-                    row_count = self.copy_table_data(db_path, original_table, new_table_name)
+                    row_count = self.copy_table_data(original_table, new_table_name)
 
-                    # 记录元数据
-                    self.cursor.execute("""
+                    # 记录元数据（整个源数据库处理完后批量写入）
+                    meta_rows.append((db_name, original_table, new_table_name, row_count))
+
+                    db_table_count += 1
+                    db_row_count += row_count
+            finally:
+                if meta_rows:
+                    self.cursor.executemany("""
                         INSERT INTO merge_metadata
                         (source_database, original_table_name, merged_table_name, row_count)
                         VALUES (?, ?, ?, ?)
-                    """, (db_name, original_table, new_table_name, row_count))
+                    """, meta_rows)
+                self.conn.commit()
+                self.cursor.execute("DETACH DATABASE src")
 
-                    existing_tables.add(new_table_name)
-                    db_table_count += 1
-                    db_row_count += row_count
+            # 数据导入完成后再建索引
+            created_tables = {original: new for _, original, new, _ in meta_rows}
+            self.create_indexes(schema['index_sql'], created_tables, db_name)
 
             self.stats['successful_merges'] += 1
             self.stats['total_tables'] += db_table_count
@@ -313,20 +541,68 @@ class SQLiteMerger:
 
     def merge_all_databases(self, base_path):
         """合并所有SQLite数据库"""
-        base_path = Path(base_path)
-
         # 查找所有SQLite文件
-        sqlite_files = list(base_path.rglob("*.sqlite"))
-        self.stats['total_databases'] = len(sqlite_files)
+        db_paths = find_sqlite_files(base_path)
+        self.stats['total_databases'] = len(db_paths)
 
         self.log(f"找到 {self.stats['total_databases']} 个SQLite数据库文件")
 
-        for db_file in sqlite_files:
-            self.merge_single_database(str(db_file))
+        # 各源数据库的结构读取互不依赖，交给进程池并行完成；
+        # 建表和复制数据仍在主进程中按顺序执行（表名冲突的解决依赖合并顺序，且输出库只有一个写入者）
+        if self._log_fh is not None:
+            self._log_fh.flush()  # 创建子进程前先刷新日志缓冲区
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            schemas = executor.map(_read_schema_for_pool, db_paths, chunksize=8)
+            for db_path, schema in zip(db_paths, schemas):
+                # 并行读取失败时 schema 为 None，由 merge_single_database 重新读取并记录错误
+                self.merge_single_database(db_path, schema)
 
         # 提交所有更改
         if self.conn:
             self.conn.commit()
+            # 建表语句保留了源库的外键定义，数据全部导入后统一检查
+            if self.enable_foreign_keys:
+                self.check_foreign_keys()
+
+    def check_foreign_keys(self):
+        """
+        检查导入后的外键约束，将违反约束的情况记录到 merge_conflicts（数据保持原样）。
+        逐表检查：外键引用的父表列既非主键也非唯一列时，SQLite 会报 "foreign key mismatch"，
+        此时只记录该表的问题，不影响其他表的检查。
+        """
+        self.cursor.execute("SELECT merged_table_name, source_database FROM merge_metadata ORDER BY id")
+        tables = self.cursor.fetchall()
+
+        violations = []
+        mismatches = []
+        for table, db_name in tables:
+            try:
+                self.cursor.execute(
+                    "SELECT parent, COUNT(*) FROM pragma_foreign_key_check(?) GROUP BY parent", (table,)
+                )
+                violations.extend((table, parent, count, db_name) for parent, count in self.cursor.fetchall())
+            except sqlite3.OperationalError as e:
+                mismatches.append((table, db_name, str(e)))
+
+        if not violations and not mismatches:
+            return
+
+        self.cursor.executemany("""
+            INSERT INTO merge_conflicts
+            (conflict_type, source_database, table_name, conflict_description, resolution_method)
+            VALUES (?, ?, ?, ?, 'kept')
+        """, [
+            ('foreign_key_violation', db_name, table, f"{count} 行引用的 {parent} 记录不存在")
+            for table, parent, count, db_name in violations
+        ] + [
+            ('foreign_key_mismatch', db_name, table, f"外键定义无法检查: {error}")
+            for table, db_name, error in mismatches
+        ])
+        self.conn.commit()
+        for table, parent, count, _ in violations:
+            self.log(f"外键约束不满足: {table} -> {parent} ({count} 行)")
+        for table, _, error in mismatches:
+            self.log(f"外键定义无法检查: {table} ({error})")
 
     def generate_merge_report(self):
         """生成合并报告"""
@@ -374,10 +650,21 @@ class SQLiteMerger:
             self.log(f"保存报告失败: {e}")
 
     def close(self):
-        """关闭数据库连接"""
+        """关闭数据库连接和日志文件"""
         if self.conn:
+            # 合并结果供后续阶段（含只读连接）读取：先将 WAL 内容全部写回主文件，
+            # 再切换回 DELETE 日志模式，使输出始终是单个自包含的数据库文件
+            try:
+                self.conn.commit()
+                self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.cursor.execute("PRAGMA journal_mode = DELETE")
+            except sqlite3.Error as e:
+                self.log(f"切换日志模式失败: {e}")
             self.conn.close()
             self.log("数据库连接已关闭")
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
 
 
 def main():
@@ -407,10 +694,16 @@ def main():
         default=50,
         help='表名前缀最大长度，用于解决冲突（默认: 50）'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='并行读取源数据库结构的进程数（默认: CPU 核数）'
+    )
     parser.add_argument(
         '--disable-foreign-keys',
         action='store_true',
-        help='禁用外键约束（默认启用）'
+        help='跳过外键检查（默认在数据全部导入后检查，并将问题记录到 merge_conflicts）'
     )
 
     args = parser.parse_args()
@@ -420,7 +713,8 @@ def main():
         output_db=args.output_db,
         log_file=args.log_file,
         table_prefix_max_len=args.table_prefix_max_len,
-        enable_foreign_keys=not args.disable_foreign_keys
+        enable_foreign_keys=not args.disable_foreign_keys,
+        max_workers=args.workers
     )
 
     Path(args.output_db).parent.mkdir(exist_ok=True)
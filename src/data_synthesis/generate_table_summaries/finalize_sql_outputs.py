@@ -1,21 +1,9 @@
-import json
 import argparse
 from pathlib import Path
 
+import orjson
 
-def get_nested_value(obj, key_path, default=None):
-    """
-    从嵌套字典中按点号路径（如 'a.b.c'）安全获取值。
-    若路径不存在，返回 default。
-    """
-    keys = key_path.split(".")
-    current = obj
-    for key in keys:
-        if isinstance(current, dict) and key in current:
-            current = current[key]
-        else:
-            return default
-    return current
+from jsonl_io import iter_jsonl_bytes
 
 
 def parse_args():
@@ -56,64 +44,63 @@ def main():
     output_path = Path(args.output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 加载数据
-    records = []
-    with open(input_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
-
-    print(f"共加载 {len(records)} 条后处理记录")
+    # 预先拆分字段路径并确定输出键名，避免逐条记录重复计算：
+    # 默认用字段路径的最后一段作为键（如 'structured_response.summary' → 'summary'），
+    # 被重命名的字段直接使用 rename_to，并与原先 pop 后重新插入的效果一致，排在输出记录末尾
+    rename_key = None
+    if args.rename_to and args.rename_from in args.fields:
+        rename_key = args.rename_from.split(".")[-1]
+    compiled_fields = []
+    renamed_fields = []
+    for field in args.fields:
+        keys = tuple(field.split("."))
+        if keys[-1] == rename_key:
+            renamed_fields.append((keys, args.rename_to))
+        else:
+            compiled_fields.append((keys, keys[-1]))
+    compiled_fields += renamed_fields
 
-    final_records = []
+    # 流式读取、提取并写出，不在内存中保留全部记录
+    total = 0
+    success_count = 0
     skipped_count = 0
 
-    for item in records:
-        # 提取所有指定字段（支持嵌套）
-        extracted = {}
-        missing = False
-        for field in args.fields:
-            value = get_nested_value(item, field)
-            if value is None:  # 注意：如果原值就是 None，也会被跳过
+    with open(output_path, "wb", buffering=1 << 20) as f:
+        for line in iter_jsonl_bytes(input_path):
+            try:
+                item = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            total += 1
+
+            # 单次遍历提取所有指定字段（支持嵌套），任一字段缺失或为 None 即跳过该记录
+            final_item = {}
+            missing = False
+            try:
+                for keys, output_key in compiled_fields:
+                    value = item
+                    for key in keys:
+                        value = value.get(key)
+                        if value is None:
+                            break
+                    if value is None:  # 注意：如果原值就是 None，也会被跳过
+                        missing = True
+                        break
+                    final_item[output_key] = value
+            except AttributeError:  # 路径中间的值不是字典
                 missing = True
-                break
-            # 使用字段的最后一段作为键（如 'structured_response.summary' → 'summary'）
-            # 但为了支持 rename，我们先保留原 field 名作为临时键
-            extracted[field] = value
-
-        if missing:
-            skipped_count += 1
-            continue
-
-        # 构建最终记录：先用字段原名（或简化名），再处理 rename
-        final_item = {}
-        for field in args.fields:
-            # 决定输出时的字段名：默认用字段路径的最后一段
-            output_key = field.split(".")[-1] if "." in field else field
-            final_item[output_key] = extracted[field]
-
-        # 执行重命名：如果 rename_to 非空 且 rename_from 在 fields 中
-        if args.rename_to and args.rename_from in args.fields:
-            # rename_from 对应的输出键（通常是 'summary'）
-            temp_key = args.rename_from.split(".")[-1]
-            if temp_key in final_item:
-                final_item[args.rename_to] = final_item.pop(temp_key)
-
-        final_records.append(final_item)
-
-    # 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for record in final_records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if missing:
+                skipped_count += 1
+                continue
+
+            f.write(orjson.dumps(final_item))
+            f.write(b"\n")
+            success_count += 1
 
     # 输出统计信息
     print(f"\n✅ 最终数据生成完成！")
-    print(f"  输入记录数: {len(records)}")
-    print(f"  成功生成: {len(final_records)} 条")
+    print(f"  输入记录数: {total}")
+    print(f"  成功生成: {success_count} 条")
     if skipped_count > 0:
         print(f"  跳过缺失字段的记录: {skipped_count} 条")
     print(f"  结果已保存至: {output_path}")
@@ -1,7 +1,12 @@
-import json
 import argparse
+import hashlib
+import re
 from pathlib import Path
 
+import orjson
+
+from jsonl_io import iter_jsonl_bytes
+
 
 def parse_args():
     """解析命令行参数"""
@@ -19,6 +24,19 @@ def parse_args():
     return parser.parse_args()
 
 
+# 模板占位符，一次扫描完成全部替换
+_PLACEHOLDER_RE = re.compile(r"\{(sql_ddl|sample_data)\}")
+
+
+def fill_prompt(prompt_template, ddl, sample):
+    """用 DDL 和样本数据填充模板，只扫描模板一次（替换内容中的占位符文本不会被再次替换）"""
+    values = {
+        "sql_ddl": ddl,
+        "sample_data": orjson.dumps(sample, option=orjson.OPT_INDENT_2).decode(),
+    }
+    return _PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], prompt_template)
+
+
 def main():
     args = parse_args()
 
@@ -45,23 +63,22 @@ def main():
     if missing:
         raise ValueError(f"模板中缺少必要占位符: {missing}")
 
-    # 加载输入数据
-    records = []
-    with open(input_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue  # 跳过损坏行
+    # 模板对所有记录相同，只在旁路文件中写一次，记录里仅保留其 sha256
+    template_output_path = output_path.with_suffix(".template.txt")
+    template_output_path.write_text(prompt_template, encoding="utf-8")
+    template_sha256 = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
 
-    print(f"共加载 {len(records)} 条 DDL 记录")
-
-    # 生成 prompt 并保存
+    # 逐行读取输入、生成 prompt 并同步写出，不在内存中保留全部记录
+    total = 0
     processed_count = 0
-    with open(output_path, "w", encoding="utf-8") as f:
-        for data in records:
+    with open(output_path, "wb", buffering=1 << 20) as f:
+        for line in iter_jsonl_bytes(input_path):
+            try:
+                data = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # 跳过损坏行
+            total += 1
+
             # 检查必要字段是否存在
             if args.ddl_field not in data or args.sample_field not in data:
                 continue
@@ -70,25 +87,24 @@ def main():
             sample = data[args.sample_field]
 
             # 填充模板
-            filled_prompt = prompt_template.replace(
-                "{sql_ddl}", ddl
-            ).replace(
-                "{sample_data}", json.dumps(sample, ensure_ascii=False, indent=2)
-            )
+            filled_prompt = fill_prompt(prompt_template, ddl, sample)
 
             # 构建 prompt_context（与前序脚本结构一致）
             if "prompt_context" not in data:
                 data["prompt_context"] = {}
-            data["prompt_context"]["prompt_template"] = prompt_template
+            data["prompt_context"]["template_sha256"] = template_sha256
             data["prompt_context"]["filled"] = filled_prompt
 
-            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            f.write(orjson.dumps(data))
+            f.write(b"\n")
             processed_count += 1
 
     # 输出统计（保留中文提示）
     print(f"\n✅ 表语义总结 prompt 生成完成！")
+    print(f"  输入记录数: {total}")
     print(f"  成功处理: {processed_count} 条")
     print(f"  结果已保存至: {output_path}")
+    print(f"  Prompt 模板已保存至: {template_output_path}")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
-import json
 import argparse
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
 
 # 常量定义（避免硬编码）
 FUNCTION_DESCRIPTION_FILE = "sqlite_functions_zh_description.jsonl"
@@ -28,57 +29,78 @@ def parse_args():
         default=FUNCTION_DESCRIPTION_FILE,
         help="SQLite 函数中文描述文件路径"
     )
+    parser.add_argument(
+        "--tables_file",
+        type=str,
+        default="output/prompts/function_compatibility_prompts.tables.jsonl",
+        help="生成 Prompt 时写出的表信息旁路文件（记录中只有 table_idx 时用于关联表的完整信息）"
+    )
     return parser.parse_args()
 
 
 def load_jsonl(file_path: Path) -> List[Dict[str, Any]]:
     """从 JSONL 文件加载记录，跳过无效行"""
+    # 一次读入整个文件并在 C 层按行切分，省去逐行迭代文件对象和 strip 的开销
+    # （记录本身就要全部载入内存，整体读取不会增加峰值占用的量级）
+    with open(file_path, "rb") as f:
+        lines = f.read().splitlines()
     records = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
+    for line in lines:
+        if line:
+            try:
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                continue  # 空白行或损坏行
     return records
 
 
-def group_records_by_table_ddl(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """按 table_name 和 create_sql 对记录进行分组，合并 structured_response"""
+def group_records_by_table_ddl(
+    records: List[Dict[str, Any]],
+    tables: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    按 table_name 和 create_sql 对记录进行分组，合并 structured_response。
+    记录带 table_idx 时，表的完整信息从 tables（表信息旁路文件）中按行号取出；
+    否则直接使用记录自身携带的表字段（兼容旧格式的 Prompt 文件）。
+    """
     grouped = []
+    # (表名, DDL) -> 分组，按键直接查找，避免逐个遍历已有分组
+    group_index: Dict[Tuple[str, str], Dict[str, Any]] = {}
     for record in records:
-        # 查找是否存在相同表名和 DDL 的分组
-        match_idx = None
-        for idx, group in enumerate(grouped):
-            if (group["table_name"] == record["table_name"] and
-                group["create_sql"] == record["create_sql"]):
-                match_idx = idx
-                break
-
-        if match_idx is not None:
+        table_idx = record.get("table_idx")
+        if table_idx is None:
+            table = record
+        elif tables is None:
+            raise ValueError("记录只包含 table_idx，请通过 --tables_file 指定表信息旁路文件")
+        else:
+            table = tables[table_idx]
+
+        key = (table["table_name"], table["create_sql"])
+        group = group_index.get(key)
+
+        if group is not None:
             # 合并 structured_response
-            grouped[match_idx]["structured_response_list"].append(record["structured_response"])
+            group["structured_response_list"].append(record["structured_response"])
         else:
             # 新建分组
             new_group = {
-                "table_name": record["table_name"],
-                "create_sql": record["create_sql"],
-                "sample_data": record["sample_data"],
-                "annotated_ddl": record["annotated_ddl"],
-                "table_summary": record["table_summary"],
-                "similar_tables": record["similar_tables"],
+                "table_name": table["table_name"],
+                "create_sql": table["create_sql"],
+                "sample_data": table["sample_data"],
+                "annotated_ddl": table["annotated_ddl"],
+                "table_summary": table["table_summary"],
+                "similar_tables": table["similar_tables"],
                 "structured_response_list": [record["structured_response"]]
             }
             grouped.append(new_group)
+            group_index[key] = new_group
     return grouped
 
 
 def extract_applicable_functions(
     grouped_records: List[Dict[str, Any]]
 ) -> List[Dict[str, Any]]:
-    """从分组记录中提取有效的 key_functions，并过滤无函数的分组"""
+    """从分组记录中提取有效的 key_functions，并过滤无函数的分组（原地修改分组记录）"""
     valid_records = []
     no_function_count = 0
 
@@ -98,10 +120,10 @@ def extract_applicable_functions(
         # 去重（可选，若顺序不重要可转为 set）
         unique_functions = list(dict.fromkeys(all_functions))  # 保持顺序去重
 
-        # 移除中间字段，添加函数列表
-        new_record = {k: v for k, v in group.items() if k != "structured_response_list"}
-        new_record["applicable_functions"] = unique_functions
-        valid_records.append(new_record)
+        # 原地移除中间字段，添加函数列表（避免复制整条记录）
+        del group["structured_response_list"]
+        group["applicable_functions"] = unique_functions
+        valid_records.append(group)
 
     print(f"分组后记录数: {len(grouped_records)}，其中无适用函数的记录数: {no_function_count}")
     return valid_records
@@ -110,37 +132,40 @@ def extract_applicable_functions(
 def load_function_descriptions(file_path: Path) -> Dict[str, str]:
     """加载 SQLite 函数的中文描述映射"""
     descriptions = {}
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data = json.loads(line)
-                descriptions.update(data)
+    with open(file_path, "rb") as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        if line.strip():
+            descriptions.update(orjson.loads(line))
     return descriptions
 
 
 def attach_function_descriptions(
     records: List[Dict[str, Any]],
     func_desc_map: Dict[str, str]
-) -> List[Dict[str, Any]]:
-    """为每条记录附加函数描述，仅保留有描述的函数"""
-    final_records = []
+) -> Iterator[Dict[str, Any]]:
+    """
+    为每条记录附加函数描述，仅保留有描述的函数（原地修改记录，逐条 yield，便于边生成边写出）。
+    函数列表相同的记录共享同一个描述字典，避免为每条记录重复构建。
+    """
+    desc_cache: Dict[Tuple[str, ...], Dict[str, str]] = {}
     for record in records:
-        func_desc_pairs = {
-            func: func_desc_map[func]
-            for func in record["applicable_functions"]
+        # 原地移除中间字段，替换为带描述的字段（避免复制整条记录）
+        # 缓存键保持函数原有顺序，输出与逐条构建时完全一致
+        functions = tuple(
+            func for func in record.pop("applicable_functions")
             if func in func_desc_map
-        }
-
-        if not func_desc_pairs:
+        )
+        if not functions:
             continue  # 跳过无描述的函数记录
 
-        # 移除中间字段，替换为带描述的字段
-        new_record = {k: v for k, v in record.items() if k != "applicable_functions"}
-        new_record["function_descriptions"] = func_desc_pairs
-        final_records.append(new_record)
+        func_desc_pairs = desc_cache.get(functions)
+        if func_desc_pairs is None:
+            func_desc_pairs = {func: func_desc_map[func] for func in functions}
+            desc_cache[functions] = func_desc_pairs
 
-    return final_records
+        record["function_descriptions"] = func_desc_pairs
+        yield record
 
 
 def main():
@@ -157,8 +182,13 @@ def main():
     records = load_jsonl(input_path)
     print(f"共加载 {len(records)} 条后处理记录")
 
-    # 2. 按表名 + DDL 分组
-    grouped_records = group_records_by_table_ddl(records)
+    # 2. 按表名 + DDL 分组（Prompt 记录只带 table_idx 时，从旁路文件取表的完整信息）
+    tables = None
+    tables_path = Path(args.tables_file)
+    if tables_path.exists():
+        tables = load_jsonl(tables_path)
+        print(f"共加载 {len(tables)} 张表的信息: {tables_path}")
+    grouped_records = group_records_by_table_ddl(records, tables)
 
     # 3. 提取有效的适用函数
     records_with_functions = extract_applicable_functions(grouped_records)
@@ -170,18 +200,18 @@ def main():
     function_descriptions = load_function_descriptions(func_desc_file)
     print(f"成功加载 {len(function_descriptions)} 个函数的中文描述")
 
-    # 5. 附加函数描述，过滤无描述项
-    final_records = attach_function_descriptions(records_with_functions, function_descriptions)
-
-    # 6. 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for record in final_records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    # 5. 附加函数描述（过滤无描述项），并逐条写出结果
+    output_count = 0
+    with open(output_path, "wb", buffering=1 << 20) as f:
+        for record in attach_function_descriptions(records_with_functions, function_descriptions):
+            f.write(orjson.dumps(record))
+            f.write(b"\n")
+            output_count += 1
 
-    # 7. 输出统计信息
+    # 6. 输出统计信息
     print(f"\n✅ 最终数据生成完成！")
     print(f"  输入记录数: {len(records)}")
-    print(f"  最终输出记录数: {len(final_records)}")
+    print(f"  最终输出记录数: {output_count}")
     print(f"  结果已保存至: {output_path}")
 
 
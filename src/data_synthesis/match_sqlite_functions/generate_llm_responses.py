@@ -1,8 +1,12 @@
-import json
 import argparse
+import asyncio
+import re
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import orjson
+from openai import AsyncOpenAI
 from tqdm import tqdm
 from pathlib import Path
 
@@ -21,7 +25,7 @@ def parse_args():
     parser.add_argument("--api_key", type=str, default="",
                         help="API 密钥（本地部署通常为空）")
     parser.add_argument("--max_workers", type=int, default=10,
-                        help="并发线程数")
+                        help="并发请求数")
     parser.add_argument("--timeout", type=int, default=120,
                         help="单个请求的超时时间（秒）")
     parser.add_argument("--enable_thinking", action="store_true",
@@ -30,6 +34,8 @@ def parse_args():
                         help="用于判断是否已处理的唯一标识字段（多个字段组合）")
     parser.add_argument("--prompt_field", type=str, default="prompt_context.filled",
                         help="JSON 数据中 prompt 内容的字段路径，使用点号分隔，如 'text' 或 'messages.0.content'")
+    parser.add_argument("--no_dedup_prompts", action="store_true",
+                        help="不合并文本完全相同的 prompt（默认相同 prompt 只请求一次，结果分发给所有对应数据项）")
     return parser.parse_args()
 
 
@@ -41,62 +47,98 @@ def get_output_filename(save_dir: str) -> str:
     return str(save_path / f"{timestamp}.jsonl")
 
 
-def get_nested_value(data: dict, field_path: str):
+def compile_field_path(field_path: str) -> list:
+    """将点号分隔的字段路径预先拆分为访问键列表，数字段转为整数（支持数组索引，如 messages.0.content）"""
+    return [int(key) if key.isdigit() else key for key in field_path.split('.')]
+
+
+def get_nested_value(data: dict, field_path: str, keys: list = None):
     """
     根据点号分隔的字段路径（如 'prompt_context.filled'）从嵌套字典中安全获取值。
+    keys 为 compile_field_path 预先拆分好的访问键，逐条取值时传入可省去重复拆分路径。
     若路径不存在，抛出 KeyError 并提示字段缺失。
     """
-    keys = field_path.split('.')
+    if keys is None:
+        keys = compile_field_path(field_path)
     current = data
     try:
         for key in keys:
-            if key.isdigit():  # 支持数组索引，如 messages.0.content
-                key = int(key)
             current = current[key]
         return current
     except (KeyError, IndexError, TypeError) as e:
         raise KeyError(f"数据中缺少字段路径 '{field_path}'（错误: {e}）")
 
 
-def load_processed_records(output_dir: str, id_fields: list) -> set:
-    """加载已处理记录的唯一标识元组集合，用于快速去重"""
+def _scan_processed_file(file_path: Path, id_fields: list, id_re) -> set:
+    """读取单个输出分片中已处理记录的唯一标识元组"""
+    keys = set()
+    # 整个分片一次读入（单次大块读取），再在 C 层按行切分
+    with open(file_path, "rb") as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        if id_re is not None:
+            m = id_re.match(line)
+            if m:
+                keys.add((int(m.group(1)),))
+                continue
+        try:
+            data = orjson.loads(line)
+            key = tuple(data.get(field) for field in id_fields)
+            if all(k is not None for k in key):
+                keys.add(key)
+        except (orjson.JSONDecodeError, KeyError):
+            continue  # 跳过格式错误或缺失字段的行
+    return keys
+
+
+def load_processed_records(output_dir: str, id_fields: list, max_workers: int = 8) -> set:
+    """加载已处理记录的唯一标识元组集合，用于快速去重（多个输出分片由线程池并行读取）"""
     processed = set()
     output_path = Path(output_dir)
 
     if not output_path.exists():
         return processed
 
-    for file_path in output_path.rglob("*.jsonl"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    key = tuple(data.get(field) for field in id_fields)
-                    if all(k is not None for k in key):
-                        processed.add(key)
-                except (json.JSONDecodeError, KeyError):
-                    continue  # 跳过格式错误或缺失字段的行
+    # 只有一个标识字段且它是记录的第一个键时（本脚本写出的记录即如此），
+    # 直接用正则从行首取出整数值，省去整行 JSON 解析；其余情况回退到 orjson.loads
+    id_re = None
+    if len(id_fields) == 1:
+        id_re = re.compile(rb'\{\s*"' + re.escape(id_fields[0].encode("utf-8")) + rb'"\s*:\s*(-?\d+)\s*[,}]')
+
+    file_paths = list(output_path.rglob("*.jsonl"))
+    if not file_paths:
+        return processed
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_paths))) as executor:
+        for keys in executor.map(lambda path: _scan_processed_file(path, id_fields, id_re), file_paths):
+            processed.update(keys)
     return processed
 
 
-def save_single_result(output_file: str, original_data:dict, generated_content: str, model_name: str):
-    """保存单条结果到输出文件"""
+# 每写入多少条结果刷新一次输出文件（中断时最多需要重新生成这么多条）
+FLUSH_EVERY = 256
+
+
+def save_single_result(output_fh, original_data:dict, generated_content: str, model_name: str):
+    """保存单条结果到已打开的输出文件（二进制追加模式）"""
     record = original_data.copy()
     record["model_name"] = model_name
     record["generated_content"] = generated_content
-    with open(output_file, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    output_fh.write(orjson.dumps(record) + b"\n")
 
 
-def process_single_prompt(client, model_name: str, prompt: str, index: int, timeout: int,
-                          enable_thinking: bool) -> tuple:
-    """处理单个 prompt 请求"""
+def get_prompt_suffix(model_name: str, enable_thinking: bool) -> str:
+    """确定追加在每个 prompt 末尾的后缀（只与模型和思考模式有关，整个批次只需计算一次）"""
     # 自动附加 /no_think（若模型不支持思考）
     if "think" not in model_name.lower() and not enable_thinking:
-        prompt += "\n/no_think"
+        return "\n/no_think"
+    return ""
+
 
+async def process_single_prompt(client, model_name: str, prompt: str, index: int, timeout: int) -> tuple:
+    """处理单个 prompt 请求（prompt 已附加好 get_prompt_suffix 的后缀）"""
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model_name,
             messages=[{"role": "user", "content": prompt}],
             stream=False,
@@ -116,12 +158,11 @@ def load_input_data(prompt_file: str) -> list:
 
     original_data = []
     if input_path.suffix == ".jsonl":
-        with open(input_path, "r", encoding="utf-8") as f:
+        with open(input_path, "rb") as f:
             for line in f:
-                original_data.append(json.loads(line.strip()))
+                original_data.append(orjson.loads(line))
     elif input_path.suffix == ".json":
-        with open(input_path, "r", encoding="utf-8") as f:
-            original_data = json.load(f)
+        original_data = orjson.loads(input_path.read_bytes())
     else:
         raise ValueError("仅支持 .json 或 .jsonl 格式的输入文件")
 
@@ -150,42 +191,71 @@ def filter_unprocessed_items(original_data: list, output_dir: str, id_fields: li
 def extract_prompts(data_list: list, prompt_field: str) -> list:
     """根据指定字段路径从数据列表中提取 prompt 文本"""
     prompts = []
+    # 字段路径只拆分一次，所有数据项复用
+    keys = compile_field_path(prompt_field)
     for item in data_list:
         try:
-            prompt_text = get_nested_value(item, prompt_field)
+            prompt_text = get_nested_value(item, prompt_field, keys)
             prompts.append(prompt_text)
         except KeyError as e:
             raise KeyError(f"无法提取 prompt：{e}")
     return prompts
 
 
-def run_batch_inference(client, model_name: str, prompts: list, unprocessed_data: list, output_file: str, max_workers: int, timeout: int, enable_thinking: bool) -> int:
-    """执行批量 LLM 推理并实时保存结果"""
+def group_identical_prompts(prompts: list, data_list: list, dedup: bool = True) -> list:
+    """
+    将文本完全相同的 prompt 合并为一组，返回 [(prompt, [数据项, ...]), ...]，顺序与首次出现顺序一致。
+    dedup 为 False 时每个数据项单独成组。
+    """
+    if not dedup:
+        return [(prompt, [item]) for prompt, item in zip(prompts, data_list)]
+
+    groups = {}
+    for prompt, item in zip(prompts, data_list):
+        groups.setdefault(prompt, []).append(item)
+    return list(groups.items())
+
+
+async def run_batch_inference(client, model_name: str, prompts: list, unprocessed_data: list, output_file: str, max_workers: int, timeout: int, enable_thinking: bool,
+                              dedup_prompts: bool = True) -> int:
+    """执行批量 LLM 推理并实时保存结果（max_workers 个协程并发请求，相同 prompt 只请求一次）"""
     results_count = 0
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_item = {
-            executor.submit(
-                process_single_prompt,
-                client, model_name, prompt, idx, timeout, enable_thinking
-            ): (idx, item)
-            for idx, (prompt, item) in enumerate(zip(prompts, unprocessed_data))
-        }
-
-        for future in tqdm(as_completed(future_to_item), total=len(unprocessed_data), desc="LLM 生成中"):
-            idx, item = future_to_item[future]
-            try:
-                result_idx, generated_content = future.result()
-
-                # 跳过明显错误的结果
-                if isinstance(generated_content, str) and "error" in generated_content.lower():
-                    print(f"跳过错误结果（索引 {result_idx}）: {generated_content[:100]}...")
+    prompt_groups = group_identical_prompts(prompts, unprocessed_data, dedup_prompts)
+    if len(prompt_groups) < len(unprocessed_data):
+        print(f"合并相同 prompt 后需请求: {len(prompt_groups)} 次（共 {len(unprocessed_data)} 条数据）")
+    pending = enumerate(prompt_groups)
+    prompt_suffix = get_prompt_suffix(model_name, enable_thinking)
+
+    # 所有协程运行在同一线程中，共用一个输出文件句柄，无需加锁
+    with open(output_file, "ab", buffering=1 << 20) as output_fh, \
+            tqdm(total=len(unprocessed_data), desc="LLM 生成中") as pbar:
+
+        async def worker():
+            nonlocal results_count
+            # 各协程从同一个迭代器中依次领取任务，完成一条再领下一条，在途请求数恒为 max_workers
+            for idx, (prompt, items) in pending:
+                try:
+                    result_idx, generated_content = await process_single_prompt(
+                        client, model_name, prompt + prompt_suffix, idx, timeout
+                    )
+                    pbar.update(len(items))
+
+                    # 跳过明显错误的结果
+                    if isinstance(generated_content, str) and "error" in generated_content.lower():
+                        print(f"跳过错误结果（索引 {result_idx}）: {generated_content[:100]}...")
+                        continue
+
+                    # 同一 prompt 的响应分发给该组内的每个数据项
+                    for item in items:
+                        save_single_result(output_fh, item, generated_content, model_name)
+                        results_count += 1
+                        if results_count % FLUSH_EVERY == 0:
+                            output_fh.flush()
+                except Exception as e:
+                    print(f"处理索引 {idx} 时发生异常: {e}")
                     continue
 
-                save_single_result(output_file, item, generated_content, model_name)
-                results_count += 1
-            except Exception as e:
-                print(f"处理索引 {idx} 时发生异常: {e}")
-                continue
+        await asyncio.gather(*(worker() for _ in range(max_workers)))
 
     return results_count
 
@@ -193,8 +263,13 @@ def run_batch_inference(client, model_name: str, prompts: list, unprocessed_data
 def main():
     args = parse_args()
 
-    # 初始化 OpenAI 兼容客户端
-    client = OpenAI(base_url=args.base_url, api_key=args.api_key)
+    # 初始化 OpenAI 兼容的异步客户端：所有协程共享一个连接池，保活连接数与并发请求数一致，
+    # 避免并发数较大时连接被反复关闭和重建
+    pool_size = args.max_workers
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    )
+    client = AsyncOpenAI(base_url=args.base_url, api_key=args.api_key, http_client=http_client)
 
     # 生成带时间戳的输出文件
     output_file = get_output_filename(args.output_dir)
@@ -214,7 +289,7 @@ def main():
     prompts = extract_prompts(unprocessed_data, args.prompt_field)
 
     # 4. 批量调用 LLM（支持断点续处理）
-    generated_count = run_batch_inference(
+    generated_count = asyncio.run(run_batch_inference(
         client=client,
         model_name=args.model_name,
         prompts=prompts,
@@ -222,8 +297,9 @@ def main():
         output_file=output_file,
         max_workers=args.max_workers,
         timeout=args.timeout,
-        enable_thinking=args.enable_thinking
-    )
+        enable_thinking=args.enable_thinking,
+        dedup_prompts=not args.no_dedup_prompts
+    ))
 
     print(f"✅ 处理完成！结果已保存至: {output_file}")
     print(f"本次成功生成: {generated_count} 条")
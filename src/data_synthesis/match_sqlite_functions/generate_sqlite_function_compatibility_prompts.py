@@ -1,10 +1,25 @@
 
+import hashlib
 import json
+import mmap
+import os
 import argparse
+import re
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Iterator, List, Dict, Any
+
+import orjson
 from tqdm import tqdm
 
+# 输出缓冲区大小：Prompt 记录累积到该字节数后再一次性写入文件
+WRITE_BUFFER_SIZE = 4 << 20
+
+# 模板占位符，一次扫描完成全部替换
+_PLACEHOLDER_RE = re.compile(
+    r"\{(FUNCTION_GROUP_NAME|FUNCTION_GROUP_DESCRIPTION|SUITABLE_SCHEMA_CHARACTERISTICS"
+    r"|UNSUITABLE_SCHEMA_CHARACTERISTICS|KEY_FUNCTIONS|MULTI_TABLE_SCHEMA_WITH_SAMPLES)\}"
+)
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -37,17 +52,29 @@ def parse_args():
     return parser.parse_args()
 
 
-def load_jsonl(file_path: str) -> List[Dict[str, Any]]:
-    records = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
-    return records
+def load_jsonl(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐条产出 JSONL 记录的生成器：用 mmap 映射整个文件，按换行符切片后直接交给 orjson 解析，
+    省去逐行的 str 解码与 strip 副本，也不在内存中保留全部记录。
+    空行和纯空白行跳过，无法解析的行静默跳过。
+    """
+    with open(file_path, "rb") as f:
+        # 空文件无法 mmap
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = size
+                if end > start:
+                    try:
+                        yield orjson.loads(mm[start:end])
+                    except orjson.JSONDecodeError:
+                        pass
+                start = end + 1
 
 
 def load_json(file_path: str) -> Any:
@@ -86,8 +113,8 @@ def main():
 
     # 加载数据
     print(f"加载表数据: {args.input_file}")
+    # 表记录以生成器形式边读边处理，不一次性载入内存
     table_records = load_jsonl(args.input_file)
-    print(f"加载 {len(table_records)} 张表")
 
     print(f"加载 SQLite 函数分组: {args.sqlite_functions_file}")
     function_groups = load_json(args.sqlite_functions_file)
@@ -96,61 +123,82 @@ def main():
     print(f"加载 Prompt 模板: {args.prompt_template_file}")
     prompt_template = load_prompt_template(args.prompt_template_file)
 
-    generated_prompts = []
-    prompt_idx = 0
+    # 模板对所有记录相同，只在旁路文件中写一次，记录里仅保留其 sha256
+    template_path = output_path.with_suffix(".template.txt")
+    template_path.write_text(prompt_template, encoding="utf-8")
+    template_sha256 = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+
+    # 表的完整信息（含 similar_tables、sample_data 等大字段）按输入顺序写入旁路文件，每张表一行；
+    # 每条 Prompt 记录只保留 table_idx（旁路文件中的行号）和表名，下游按 table_idx 关联
+    tables_path = output_path.with_suffix(".tables.jsonl")
+
+    # 函数分组的字段与表无关，在表循环外一次性取出并序列化
+    prepared_groups = []
+    for func_group in function_groups:
+        try:
+            prepared_groups.append({
+                "FUNCTION_GROUP_NAME": func_group["name"],
+                "FUNCTION_GROUP_DESCRIPTION": func_group["description"],
+                "SUITABLE_SCHEMA_CHARACTERISTICS": func_group.get("suitable_schemas", ""),
+                "UNSUITABLE_SCHEMA_CHARACTERISTICS": func_group.get("unsuitable_schemas", ""),
+                "KEY_FUNCTIONS": orjson.dumps(func_group.get("key_functions", []), option=orjson.OPT_INDENT_2).decode(),
+            })
+        except KeyError as e:
+            print(f"⚠️ 函数分组缺少必要字段 {e}，跳过: {func_group.get('name', 'unknown')}")
 
-    for table_data in tqdm(table_records):
-        # 构建多表上下文（主表 + 相似表）
-        multi_table_context = build_multi_table_context(
-            main_table=table_data,
-            similar_tables=table_data.get("similar_tables", [])
-        )
-
-        # 为每个函数分组生成一个 Prompt
-        for func_group in function_groups:
-            try:
-                name = func_group["name"]
-                description = func_group["description"]
-                suitable = func_group.get("suitable_schemas", "")
-                unsuitable = func_group.get("unsuitable_schemas", "")
-                key_funcs = func_group.get("key_functions", [])
-            except KeyError as e:
-                print(f"⚠️ 函数分组缺少必要字段 {e}，跳过: {func_group.get('name', 'unknown')}")
-                continue
-
-            # 渲染 Prompt
-            filled_prompt = (
-                prompt_template
-                .replace("{FUNCTION_GROUP_NAME}", name)
-                .replace("{FUNCTION_GROUP_DESCRIPTION}", description)
-                .replace("{SUITABLE_SCHEMA_CHARACTERISTICS}", suitable)
-                .replace("{UNSUITABLE_SCHEMA_CHARACTERISTICS}", unsuitable)
-                .replace("{KEY_FUNCTIONS}", json.dumps(key_funcs, ensure_ascii=False, indent=2))
-                .replace("{MULTI_TABLE_SCHEMA_WITH_SAMPLES}", json.dumps(multi_table_context, ensure_ascii=False, indent=2))
+    prompt_idx = 0
+    table_count = 0
+
+    # 边生成边写出，不在内存中保留全部记录；Prompt 记录先累积在缓冲区中，按块写入
+    buf = bytearray()
+    with open(output_path, "wb") as f, \
+            open(tables_path, "wb", buffering=1 << 20) as tables_f:
+        for table_idx, table_data in enumerate(tqdm(table_records, desc="生成 Prompt")):
+            table_count += 1
+            tables_f.write(orjson.dumps(table_data))
+            tables_f.write(b"\n")
+            # 构建多表上下文（主表 + 相似表）
+            multi_table_context = build_multi_table_context(
+                main_table=table_data,
+                similar_tables=table_data.get("similar_tables", [])
             )
-
-            # 构建输出记录：一张表 + 一个函数组 = 一条记录
-            output_record = {
-                "prompt_id": prompt_idx,
-            }
-
-            output_record.update(table_data)
-
-            output_record['prompt_context'] = {}
-            output_record['prompt_context']['template'] = prompt_template
-            output_record['prompt_context']['filled'] = filled_prompt
-
-            generated_prompts.append(output_record)
-            prompt_idx += 1
-
-    # 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for record in generated_prompts:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # 多表上下文只与当前表有关，每张表只序列化一次，供所有函数分组复用
+            multi_table_json = orjson.dumps(multi_table_context, option=orjson.OPT_INDENT_2).decode()
+
+            # 为每个函数分组生成一个 Prompt
+            for values in prepared_groups:
+                # 渲染 Prompt（一次扫描模板完成全部占位符替换）
+                values["MULTI_TABLE_SCHEMA_WITH_SAMPLES"] = multi_table_json
+                filled_prompt = _PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], prompt_template)
+
+                # 构建输出记录：一张表 + 一个函数组 = 一条记录
+                output_record = {
+                    "prompt_id": prompt_idx,
+                    "table_idx": table_idx,
+                    "table_name": table_data.get("table_name", ""),
+                    "function_group": values["FUNCTION_GROUP_NAME"],
+                    "prompt_context": {
+                        "template_sha256": template_sha256,
+                        "filled": filled_prompt,
+                    },
+                }
+
+                buf += orjson.dumps(output_record)
+                buf += b"\n"
+                prompt_idx += 1
+
+            if len(buf) > WRITE_BUFFER_SIZE:
+                f.write(buf)
+                buf.clear()
+
+        f.write(buf)
 
     print(f"\n✅ Prompt 生成完成！")
-    print(f"  总 Prompt 数量: {len(generated_prompts)}")
+    print(f"  处理表数量: {table_count}")
+    print(f"  总 Prompt 数量: {prompt_idx}")
     print(f"  输出文件: {output_path}")
+    print(f"  Prompt 模板: {template_path}")
+    print(f"  表信息: {tables_path}")
 
 
 if __name__ == "__main__":
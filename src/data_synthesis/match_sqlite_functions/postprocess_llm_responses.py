@@ -1,10 +1,11 @@
-import json
 import os
 import re
 import argparse
 from pathlib import Path
-from tqdm import tqdm
+
 import json_repair
+import orjson
+from tqdm import tqdm
 
 
 def parse_args():
@@ -53,15 +54,15 @@ def load_all_responses(input_dir: str) -> list:
         raise FileNotFoundError(f"输入目录不存在: {input_dir}")
 
     for file_path in input_path.rglob("*.jsonl"):
-        with open(file_path, "r", encoding="utf-8") as f:
+        with open(file_path, "rb") as f:
             for line in f:
                 line = line.strip()
                 if not line:
                     continue
                 try:
-                    data = json.loads(line)
+                    data = orjson.loads(line)
                     responses.append(data)
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     continue  # 跳过损坏行
     return responses
 
@@ -99,9 +100,10 @@ def main():
         processed_responses.append(record)
 
     # 3. 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
+    with open(output_path, "wb", buffering=1 << 20) as f:
         for data in processed_responses:
-            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            f.write(orjson.dumps(data))
+            f.write(b"\n")
 
     # 4. 输出统计信息
     success_count = len(processed_responses)
@@ -11,12 +11,13 @@ for item in data:
 
     all_key_functions.extend(key_functions)
 
-所有函数名称和描述 = []
+# 用集合保存已有描述的函数名，成员判断为 O(1)
+所有函数名称和描述 = set()
 with open("sqlite_functions_zh_description.jsonl", encoding="utf-8") as f:
     for line in f:
         data = json.loads(line)
 
-        所有函数名称和描述.extend(list(data.keys()))
+        所有函数名称和描述.update(data.keys())
 
 for key_functions in all_key_functions:
     if key_functions not in 所有函数名称和描述:
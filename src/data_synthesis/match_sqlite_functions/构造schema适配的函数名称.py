@@ -1,12 +1,22 @@
+import hashlib
 import json
+import re
+
+import orjson
+
+# 模板占位符，一次扫描完成全部替换
+PLACEHOLDER_RE = re.compile(
+    r"\{(FUNCTION_GROUP_NAME|FUNCTION_GROUP_DESCRIPTION|SUITABLE_SCHEMA_CHARACTERISTICS"
+    r"|UNSUITABLE_SCHEMA_CHARACTERISTICS|KEY_FUNCTIONS|MULTI_TABLE_SCHEMA_WITH_SAMPLES)\}"
+)
 
 if __name__ == '__main__':
     xxx = []
 
-    with open("../使用向量模型为每个表找到相似的表/output/final/similarity_enhanced_tables.jsonl", encoding="utf-8") as f:
+    with open("../使用向量模型为每个表找到相似的表/output/final/similarity_enhanced_tables.jsonl", "rb") as f:
 
         for line in f:
-            data = json.loads(line)
+            data = orjson.loads(line)
 
             xxx.append(data)
 
@@ -18,32 +28,24 @@ if __name__ == '__main__':
 
     prompt_template = open("prompts/sqlite_schema_function_compatibility_prompt.txt", encoding="utf-8").read().strip()
 
-    idx = 0
-
-    ttt = []
-
-    for data in xxx:
-        table_name = data['table_name']
-        create_sql = data['create_sql']
-        sample_data = data['sample_data']
-        annotated_ddl = data['annotated_ddl']
-        table_summary = data['table_summary']
-        similar_tables = data['similar_tables']
+    # 模板只写入旁路文件一次，记录里仅保留其 sha256
+    with open("xxx.template.txt", "w", encoding="utf-8") as f:
+        f.write(prompt_template)
+    template_sha256 = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
 
-        MULTI_TABLE_SCHEMA_WITH_SAMPLES = []
+    idx = 0
 
-        MULTI_TABLE_SCHEMA_WITH_SAMPLES.append({
-            'table_name': table_name,
-            'create_sql': annotated_ddl,
-            'sample_data': sample_data,
-        })
+    # 边生成边写出，不在内存中保留全部记录
+    with open("xxx.jsonl", "wb", buffering=1 << 20) as f:
+        for data in xxx:
+            table_name = data['table_name']
+            create_sql = data['create_sql']
+            sample_data = data['sample_data']
+            annotated_ddl = data['annotated_ddl']
+            table_summary = data['table_summary']
+            similar_tables = data['similar_tables']
 
-        for similar_table in similar_tables:
-            table_name = similar_table['table_name']
-            create_sql = similar_table['create_sql']
-            sample_data = similar_table['sample_data']
-            annotated_ddl = similar_table['annotated_ddl']
-            table_summary = similar_table['table_summary']
+            MULTI_TABLE_SCHEMA_WITH_SAMPLES = []
 
             MULTI_TABLE_SCHEMA_WITH_SAMPLES.append({
                 'table_name': table_name,
@@ -51,34 +53,48 @@ if __name__ == '__main__':
                 'sample_data': sample_data,
             })
 
-        for zzz in yyy:
-            name = zzz['name']
-            description = zzz['description']
-            suitable_schemas = zzz['suitable_schemas']
-            unsuitable_schemas = zzz['unsuitable_schemas']
-            key_functions = zzz['key_functions']
-
-            hhh = (prompt_template
-             .replace("{FUNCTION_GROUP_NAME}", name)
-             .replace("{FUNCTION_GROUP_DESCRIPTION}", description)
-             .replace("{SUITABLE_SCHEMA_CHARACTERISTICS}", suitable_schemas)
-             .replace("{UNSUITABLE_SCHEMA_CHARACTERISTICS}", unsuitable_schemas)
-             .replace("{KEY_FUNCTIONS}", json.dumps(key_functions, ensure_ascii=False, indent=2))
-             .replace("{MULTI_TABLE_SCHEMA_WITH_SAMPLES}", json.dumps(MULTI_TABLE_SCHEMA_WITH_SAMPLES, ensure_ascii=False, indent=2))
-             )
-
-            data['prompt_context'] = {}
-            data['prompt_context']['template'] = prompt_template
-            data['prompt_context']['filled'] = hhh
-
-            data['idx'] = idx
-
-            idx += 1
-
-            ttt.append(data)
-
-    with open("xxx.jsonl", "w", encoding="utf-8") as f:
-        for data in ttt:
-            f.write(json.dumps(data, ensure_ascii=False))
-            f.write("\n")
-            f.flush()
+            for similar_table in similar_tables:
+                table_name = similar_table['table_name']
+                create_sql = similar_table['create_sql']
+                sample_data = similar_table['sample_data']
+                annotated_ddl = similar_table['annotated_ddl']
+                table_summary = similar_table['table_summary']
+
+                MULTI_TABLE_SCHEMA_WITH_SAMPLES.append({
+                    'table_name': table_name,
+                    'create_sql': annotated_ddl,
+                    'sample_data': sample_data,
+                })
+
+            multi_table_json = orjson.dumps(MULTI_TABLE_SCHEMA_WITH_SAMPLES, option=orjson.OPT_INDENT_2).decode()
+
+            for zzz in yyy:
+                name = zzz['name']
+                description = zzz['description']
+                suitable_schemas = zzz['suitable_schemas']
+                unsuitable_schemas = zzz['unsuitable_schemas']
+                key_functions = zzz['key_functions']
+
+                values = {
+                    "FUNCTION_GROUP_NAME": name,
+                    "FUNCTION_GROUP_DESCRIPTION": description,
+                    "SUITABLE_SCHEMA_CHARACTERISTICS": suitable_schemas,
+                    "UNSUITABLE_SCHEMA_CHARACTERISTICS": unsuitable_schemas,
+                    "KEY_FUNCTIONS": orjson.dumps(key_functions, option=orjson.OPT_INDENT_2).decode(),
+                    "MULTI_TABLE_SCHEMA_WITH_SAMPLES": multi_table_json,
+                }
+                hhh = PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], prompt_template)
+
+                # 每个函数分组构造一条新记录，不能直接修改并复用同一个 data 对象，
+                # 否则该表的所有记录都会指向最后一次渲染的 prompt_context 和 idx
+                record = {**data}
+                record['prompt_context'] = {
+                    'template_sha256': template_sha256,
+                    'filled': hhh,
+                }
+                record['idx'] = idx
+
+                idx += 1
+
+                f.write(orjson.dumps(record))
+                f.write(b"\n")
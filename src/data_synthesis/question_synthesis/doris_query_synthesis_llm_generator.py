@@ -1,14 +1,17 @@
-import json
+import asyncio
+import re
 import time
 import os
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from openai import OpenAI, APIError
+from operator import itemgetter
+from openai import AsyncOpenAI, APIError
 from tqdm import tqdm
 from pathlib import Path  # 需要导入pathlib
 import random
 
-client = OpenAI(
+import orjson
+
+client = AsyncOpenAI(
     base_url="http://localhost:8000/v1",
     api_key=""
 )
@@ -18,7 +21,7 @@ base_url = "http://192.168.2.3:42434/v1"
 # model_name = "Qwen3-32B"
 model_name = "Qwen3-30B-A3B"
 
-client = OpenAI(
+client = AsyncOpenAI(
     base_url=base_url,
     api_key=""
 )
@@ -26,16 +29,17 @@ client = OpenAI(
 enable_thinking = False
 
 
-def process_single_prompt(prompt: str, index: int, timeout:int=30, enable_thinking=False) -> tuple:
-    """处理单个prompt，返回原始索引+生成结果"""
-    if "think" not in model_name.lower():
-        if enable_thinking:
-            pass
-        else:
-            prompt += "\n/no_think"
+def get_prompt_suffix(enable_thinking=False) -> str:
+    """确定追加在每个prompt末尾的后缀（只与模型和思考模式有关，整个批次只需计算一次）"""
+    if "think" not in model_name.lower() and not enable_thinking:
+        return "\n/no_think"
+    return ""
+
 
+async def process_single_prompt(prompt: str, index: int, timeout:int=30) -> tuple:
+    """处理单个prompt（已附加好后缀），返回原始索引+生成结果"""
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model_name,
             messages=[
                 # {'role': 'system', 'content': 'You are a helpful assistant specializing in database DDL comments.'},
@@ -50,26 +54,36 @@ def process_single_prompt(prompt: str, index: int, timeout:int=30, enable_thinki
         return (index, f"ERROR: {str(e)}")
 
 
+# 结果记录以 index 字段开头（见 save_single_result），可直接从行首取出索引而不解析整行
+_INDEX_RE = re.compile(rb'\{\s*"index"\s*:\s*(-?\d+)\s*[,}]')
+
+
 def load_processed_indices(output_file: str) -> set:
     """加载已处理的索引"""
     processed_indices = set()
 
     output_path = Path(output_file)  # 转换为Path对象
-    for root, dirs, files in os.walk(output_path.parent):  # 使用Path对象的parent
-        for file in files:
-            if 'jsonl' not in file:
-                continue
-
-            file_path = os.path.join(root, file)
-            with open(file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    data = json.loads(line)
-                    processed_indices.add(data['index'])
+    for file_path in output_path.parent.rglob("*jsonl*"):
+        if not file_path.is_file():
+            continue
+        # 整个文件一次读入（单次大块读取），再在 C 层按行切分
+        with open(file_path, "rb") as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            m = _INDEX_RE.match(line)
+            if m:
+                processed_indices.add(int(m.group(1)))
+            else:
+                processed_indices.add(orjson.loads(line)['index'])
     return processed_indices
 
 
-def save_single_result(output_file: str, index: int, original_data: dict, generated_content: str):
-    """保存单条结果到JSONL文件"""
+# 每写入多少条结果刷新一次输出文件（中断时最多需要重新生成这么多条）
+FLUSH_EVERY = 256
+
+
+def save_single_result(output_fh, index: int, original_data: dict, generated_content: str):
+    """保存单条结果到已打开的JSONL文件（二进制追加模式），并返回写入的记录"""
     result_item = {
         "index": index,
         "original_data": original_data,
@@ -78,12 +92,13 @@ def save_single_result(output_file: str, index: int, original_data: dict, genera
         "process_time": datetime.now().isoformat()
     }
 
-    with open(output_file, "a", encoding="utf-8") as f:
-        f.write(json.dumps(result_item, ensure_ascii=False) + "\n")
+    output_fh.write(orjson.dumps(result_item) + b"\n")
+    return result_item
 
 
-def llm_batch_inference(prompts: list, original_data: list, output_file: str, max_workers: int = 5, enable_thinking=False) -> list:
-    """批量处理prompt，支持断点续处理"""
+async def llm_batch_inference(prompts: list, original_data: list, output_file: str, max_workers: int = 5, enable_thinking=False,
+                              dedup_prompts=True) -> list:
+    """批量处理prompt，支持断点续处理（max_workers 个协程并发请求，相同 prompt 只请求一次）"""
     # 加载已处理的索引
     processed_indices = load_processed_indices(output_file)
 
@@ -99,39 +114,54 @@ def llm_batch_inference(prompts: list, original_data: list, output_file: str, ma
         print("所有数据已处理完成！")
         return []
 
+    # 文本完全相同的 prompt 只请求一次，响应分发给所有对应的索引
+    if dedup_prompts:
+        groups = {}
+        for idx, prompt, data in tasks:
+            groups.setdefault(prompt, []).append((idx, data))
+        task_groups = list(groups.items())
+        if len(task_groups) < len(tasks):
+            print(f"合并相同 prompt 后需请求: {len(task_groups)} 次")
+    else:
+        task_groups = [(prompt, [(idx, data)]) for idx, prompt, data in tasks]
+
     results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交任务
-        future_to_index = {
-            executor.submit(process_single_prompt, prompt, idx, 120, enable_thinking): (idx, data)
-            for idx, prompt, data in tasks
-        }
-
-        # 处理完成的任务
-        for future in tqdm(as_completed(future_to_index), total=len(tasks), desc="LLM生成中"):
-            idx, original_data_item = future_to_index[future]
-            try:
-                result_idx, generated_content = future.result()
-
-                if "error" in generated_content.lower():
+    pending = iter(task_groups)
+    prompt_suffix = get_prompt_suffix(enable_thinking)
+    # 所有协程运行在同一线程中，共用一个输出文件句柄，无需加锁
+    with open(output_file, "ab", buffering=1 << 20) as output_fh, \
+            tqdm(total=len(tasks), desc="LLM生成中") as pbar:
+
+        async def worker():
+            # 各协程从同一个迭代器中依次领取任务，完成一条再领下一条，在途请求数恒为 max_workers
+            for prompt, group in pending:
+                idx, original_data_item = group[0]
+                try:
+                    result_idx, generated_content = await process_single_prompt(prompt + prompt_suffix, idx, 120)
+                    pbar.update(len(group))
+
+                    if "error" in generated_content.lower():
+                        continue
+
+                    # 立即保存单条结果，同时保留完整记录，供生成完整合并文件时直接使用；
+                    # 同一 prompt 的响应按各自索引分别保存
+                    for result_idx, original_data_item in group:
+                        results.append(
+                            save_single_result(output_fh, result_idx, original_data_item, generated_content)
+                        )
+                        if len(results) % FLUSH_EVERY == 0:
+                            output_fh.flush()
+                except Exception as e:
+                    print(f"索引{idx}任务执行异常: {str(e)}")
                     continue
+                    # 即使出错也保存错误信息，避免重复处理
+                    save_single_result(output_fh, idx, original_data_item, f"ERROR: 任务执行异常 - {str(e)}")
+                    results.append({
+                        "index": idx,
+                        "generated_content": f"ERROR: 任务执行异常 - {str(e)}"
+                    })
 
-                # 立即保存单条结果
-                save_single_result(output_file, result_idx, original_data_item, generated_content)
-                results.append({
-                    "index": result_idx,
-                    "model_name": model_name,
-                    "generated_content": generated_content
-                })
-            except Exception as e:
-                print(f"索引{idx}任务执行异常: {str(e)}")
-                continue
-                # 即使出错也保存错误信息，避免重复处理
-                save_single_result(output_file, idx, original_data_item, f"ERROR: 任务执行异常 - {str(e)}")
-                results.append({
-                    "index": idx,
-                    "generated_content": f"ERROR: 任务执行异常 - {str(e)}"
-                })
+        await asyncio.gather(*(worker() for _ in range(max_workers)))
 
     return results
 
@@ -148,15 +178,15 @@ if __name__ == '__main__':
     doris_prompt_data = []
 
     if prompt_input_path.endswith(".jsonl"):
-        with open(prompt_input_path, "r", encoding="utf-8") as f:
+        with open(prompt_input_path, "rb") as f:
             for line in f:
-                data = json.loads(line)
+                data = orjson.loads(line)
 
                 doris_prompt_data.append(data)
 
     elif prompt_input_path.endswith(".json"):
-        with open(prompt_input_path, "r", encoding="utf-8") as f:
-            doris_prompt_data = json.load(f)
+        with open(prompt_input_path, "rb") as f:
+            doris_prompt_data = orjson.loads(f.read())
 
     print(f"成功加载{len(doris_prompt_data)}条prompt数据")
 
@@ -171,29 +201,24 @@ if __name__ == '__main__':
     prompts = [item['doris_question_synthesis']["prompt"] for item in doris_prompt_data]
 
     # 4. 批量调用LLM（支持断点续处理）
-    generated_contents = llm_batch_inference(
+    generated_contents = asyncio.run(llm_batch_inference(
         prompts=prompts,
         original_data=doris_prompt_data,
         output_file=output_file,
         max_workers=10,  # 可根据需要调整并发数
         enable_thinking=enable_thinking
-    )
+    ))
 
     print(f"处理完成！结果已保存至: {output_file}")
 
     # 5. 可选：生成完整的合并文件（用于后续处理）
+    # 本次生成的完整记录已由 llm_batch_inference 返回，无需再读回输出文件
     if generated_contents:
         complete_output_file = output_file.replace(".jsonl", "_complete.json")
-        complete_data = []
-        with open(output_file, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    item = json.loads(line)
-                    complete_data.append(item)
 
         # 按索引排序
-        complete_data.sort(key=lambda x: x["index"])
+        complete_data = sorted(generated_contents, key=itemgetter("index"))
 
-        with open(complete_output_file, "w", encoding="utf-8") as f:
-            json.dump(complete_data, f, ensure_ascii=False, indent=2)
+        with open(complete_output_file, "wb") as f:
+            f.write(orjson.dumps(complete_data, option=orjson.OPT_INDENT_2))
         print(f"完整合并文件已保存至: {complete_output_file}")
\ No newline at end of file
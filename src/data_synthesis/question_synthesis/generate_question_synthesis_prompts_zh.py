@@ -1,16 +1,25 @@
-import json
 import os
 import random
 import argparse
+import string
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple
+
+import orjson
 from tqdm import tqdm
 
+from jsonl_io import iter_jsonl_bytes
+
+
 # ==================== 常量配置（集中管理，便于维护）====================
 SUPPORTED_STYLES = [
     "Formal", "Colloquial", "Imperative", "Interrogative",
     "Descriptive", "Concise", "Vague", "Metaphorical", "Multi-turn Dialogue"
 ]
 
+# 主模板中随每条记录变化的占位符，其余占位符在启动时按风格预先填充
+RECORD_FIELDS = ("schema", "sql")
+
 # 模板文件映射（避免硬编码分散）
 TEMPLATE_CONFIG = {
     "main": "question_synthesis_prompt_zh.txt",
@@ -52,11 +61,13 @@ def load_jsonl_file(file_path: str) -> List[Dict]:
     """
     data_list = []
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    data_list.append(json.loads(line))
+        # 分块读取二进制内容并按换行符切分，orjson 直接解析 bytes，省去逐行解码与 strip
+        for line in iter_jsonl_bytes(file_path):
+            try:
+                data_list.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                if line.strip():
+                    raise  # 纯空白行跳过，真正损坏的行仍报错
     except Exception as e:
         raise RuntimeError(f"读取 JSONL 文件失败 ({file_path}): {e}")
     return data_list
@@ -79,6 +90,12 @@ def load_jsonl_files(file_paths: List[str]) -> List[Dict]:
         print(f"   ✅ 成功加载 {len(file_data)} 条数据")
     return all_data
 
+def _read_template_file(file_path: str) -> str:
+    """读取单个模板文件"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
 def load_prompt_templates(template_dir: str) -> Tuple[str, Dict[str, Dict[str, str]], Dict[str, str]]:
     """
     加载所有 Prompt 模板文件（主模板、类型模板、风格模板）。
@@ -89,30 +106,52 @@ def load_prompt_templates(template_dir: str) -> Tuple[str, Dict[str, Dict[str, s
     Returns:
         (主模板内容, 类型模板字典, 风格描述字典)
     """
-    # 加载主模板
-    main_template_path = os.path.join(template_dir, TEMPLATE_CONFIG["main"])
-    with open(main_template_path, "r", encoding="utf-8") as f:
-        main_template = f.read()
-
-    # 加载类型模板
-    type_templates = {}
-    for template_type, file_map in TEMPLATE_CONFIG["type_templates"].items():
-        type_templates[template_type] = {}
-        for key, filename in file_map.items():
-            file_path = os.path.join(template_dir, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                type_templates[template_type][key] = f.read().strip()
-
-    # 加载风格描述模板
-    style_descriptions = {}
-    for style, filename in TEMPLATE_CONFIG["style_templates"].items():
-        file_path = os.path.join(template_dir, filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            style_descriptions[style] = f.read().strip()
+    # 汇总所有模板文件名（同一文件被多个类型引用时只读取一次），并发读取
+    filenames = {TEMPLATE_CONFIG["main"], *TEMPLATE_CONFIG["style_templates"].values()}
+    for file_map in TEMPLATE_CONFIG["type_templates"].values():
+        filenames.update(file_map.values())
+    filenames = sorted(filenames)
+    with ThreadPoolExecutor(max_workers=min(16, len(filenames))) as executor:
+        contents = dict(zip(filenames, executor.map(
+            lambda filename: _read_template_file(os.path.join(template_dir, filename)), filenames
+        )))
+
+    # 主模板
+    main_template = contents[TEMPLATE_CONFIG["main"]]
+
+    # 类型模板
+    type_templates = {
+        template_type: {key: contents[filename].strip() for key, filename in file_map.items()}
+        for template_type, file_map in TEMPLATE_CONFIG["type_templates"].items()
+    }
+
+    # 风格描述模板
+    style_descriptions = {
+        style: contents[filename].strip()
+        for style, filename in TEMPLATE_CONFIG["style_templates"].items()
+    }
 
     return main_template, type_templates, style_descriptions
 
 
+def template_type_for_style(style_name: str) -> str:
+    """
+    根据问题风格确定对应的 Prompt 类型模板名称（TEMPLATE_CONFIG["type_templates"] 的键）。
+
+    Args:
+        style_name: 风格名称
+
+    Returns:
+        类型模板名称
+    """
+    if style_name in {"Vague", "Metaphorical"}:
+        return "w_ek"
+    elif style_name == "Multi-turn Dialogue":
+        return "multi_round"
+    else:
+        return "wo_ek"
+
+
 def select_template_by_style(style_name: str, type_templates: Dict[str, Dict[str, str]]) -> Dict[str, str]:
     """
     根据问题风格选择对应的 Prompt 类型模板。
@@ -124,12 +163,61 @@ def select_template_by_style(style_name: str, type_templates: Dict[str, Dict[str
     Returns:
         选中的模板字典
     """
-    if style_name in {"Vague", "Metaphorical"}:
-        return type_templates["w_ek"]
-    elif style_name == "Multi-turn Dialogue":
-        return type_templates["multi_round"]
-    else:
-        return type_templates["wo_ek"]
+    return type_templates[template_type_for_style(style_name)]
+
+
+def compile_main_template(
+        main_template: str,
+        type_templates: Dict[str, Dict[str, str]],
+        style_descriptions: Dict[str, str],
+        sql_engine: str
+) -> Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """
+    按风格预先编译主模板：除 RECORD_FIELDS 外的占位符（风格描述、引擎、类型模板）都提前填好，
+    模板只解析一次，每条记录只需拼接片段。
+
+    Args:
+        main_template: 主 Prompt 模板
+        type_templates: 类型模板字典
+        style_descriptions: 风格描述字典
+        sql_engine: SQL 引擎类型
+
+    Returns:
+        {风格: (文本片段, 片段之间的记录字段名)}，文本片段比字段名多一个
+    """
+    formatter = string.Formatter()
+    parsed = list(formatter.parse(main_template))
+    compiled = {}
+    for style in SUPPORTED_STYLES:
+        fixed_values = dict(
+            select_template_by_style(style, type_templates),
+            style_desc=style_descriptions[style],
+            engine=sql_engine,
+        )
+        literals = [""]
+        slots = []
+        for literal_text, field_name, format_spec, conversion in parsed:
+            literals[-1] += literal_text
+            if field_name is None:
+                continue
+            if field_name in RECORD_FIELDS and not format_spec and not conversion:
+                slots.append(field_name)
+                literals.append("")
+            else:
+                value = formatter.convert_field(fixed_values[field_name], conversion)
+                literals[-1] += formatter.format_field(value, format_spec)
+        compiled[style] = (tuple(literals), tuple(slots))
+    return compiled
+
+
+def render_compiled_template(compiled: Tuple[Tuple[str, ...], Tuple[str, ...]], values: Dict[str, str]) -> str:
+    """用记录字段填充 compile_main_template 编译出的模板"""
+    literals, slots = compiled
+    parts = [literals[0]]
+    for field_name, literal in zip(slots, literals[1:]):
+        parts.append(values[field_name])
+        parts.append(literal)
+    return "".join(parts)
 
 
 def generate_prompt_for_item(
@@ -137,7 +225,9 @@ def generate_prompt_for_item(
         main_template: str,
         type_templates: Dict[str, Dict[str, str]],
         style_descriptions: Dict[str, str],
-        sql_engine: str
+        sql_engine: str,
+        selected_style: Optional[str] = None,
+        compiled_templates: Optional[Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]]] = None
 ) -> Optional[Dict]:
     """
     为单个 SQL 条目生成问题合成 Prompt。
@@ -148,6 +238,8 @@ def generate_prompt_for_item(
         type_templates: 类型模板字典
         style_descriptions: 风格描述字典
         sql_engine: SQL 引擎类型（如 'doris', 'sqlite', 'mysql'）
+        selected_style: 预先选定的问题风格；为 None 时随机选择
+        compiled_templates: compile_main_template 的结果；提供时直接拼接，不再逐条解析主模板
 
     Returns:
         添加了 prompt 元数据的 sql_item，或 None（如数据异常）
@@ -158,35 +250,36 @@ def generate_prompt_for_item(
         if isinstance(schema_str, list):
             schema_str = "\n\n".join(schema_str)
 
-        # 随机选择风格
-        selected_style = random.choice(SUPPORTED_STYLES)
-        style_desc = style_descriptions[selected_style]
-        selected_type_template = select_template_by_style(selected_style, type_templates)
-
+        # 未预先指定时随机选择风格
+        if selected_style is None:
+            selected_style = random.choice(SUPPORTED_STYLES)
         # 填充主模板
-        filled_prompt = main_template.format(
-            style_desc=style_desc,
-            engine=sql_engine,
-            schema=schema_str,
-            sql=sql_item['synthesis_sql'],
-            steps=selected_type_template["steps"],
-            guidelines=selected_type_template["guidelines"],
-            output_format=selected_type_template["output_format"],
-            instruction=selected_type_template["instruction"],
-        )
-
-        # 注入元数据
+        if compiled_templates is not None:
+            filled_prompt = render_compiled_template(
+                compiled_templates[selected_style],
+                {"schema": schema_str, "sql": sql_item['synthesis_sql']}
+            )
+        else:
+            style_desc = style_descriptions[selected_style]
+            selected_type_template = select_template_by_style(selected_style, type_templates)
+            filled_prompt = main_template.format(
+                style_desc=style_desc,
+                engine=sql_engine,
+                schema=schema_str,
+                sql=sql_item['synthesis_sql'],
+                steps=selected_type_template["steps"],
+                guidelines=selected_type_template["guidelines"],
+                output_format=selected_type_template["output_format"],
+                instruction=selected_type_template["instruction"],
+            )
+
+        # 注入元数据（风格描述与类型模板各条记录相同，只写入旁路文件，按 style 查找）
         sql_item["question_synthesis_metadata"] = {
             "prompt": filled_prompt,
             "style": selected_style,
-            "style_description": style_desc,
             "engine": sql_engine,
             "sql": sql_item['synthesis_sql'],
             "schema": schema_str,
-            "steps": selected_type_template["steps"],
-            "guidelines": selected_type_template["guidelines"],
-            "output_format": selected_type_template["output_format"],
-            "instruction": selected_type_template["instruction"],
         }
         return sql_item
 
@@ -198,6 +291,60 @@ def generate_prompt_for_item(
         return None
 
 
+# 子进程中复用的模板与配置，由进程池初始化函数设置一次，避免随每个任务重复序列化
+_WORKER_CONTEXT: Dict = {}
+
+
+def _init_prompt_worker(
+        main_template: str,
+        type_templates: Dict[str, Dict[str, str]],
+        style_descriptions: Dict[str, str],
+        sql_engine: str
+) -> None:
+    """进程池初始化函数：保存模板与引擎配置，并在子进程内编译一次主模板"""
+    _WORKER_CONTEXT.update(
+        main_template=main_template,
+        type_templates=type_templates,
+        style_descriptions=style_descriptions,
+        sql_engine=sql_engine,
+        compiled_templates=compile_main_template(main_template, type_templates, style_descriptions, sql_engine),
+    )
+
+
+def _generate_prompt_in_worker(sql_item: Dict, selected_style: str) -> Optional[Dict]:
+    """在子进程中为单个 SQL 条目生成 Prompt"""
+    return generate_prompt_for_item(sql_item, selected_style=selected_style, **_WORKER_CONTEXT)
+
+
+def write_templates_file(
+        type_templates: Dict[str, Dict[str, str]],
+        style_descriptions: Dict[str, str],
+        output_path: str
+) -> str:
+    """
+    将类型模板、风格描述及风格到类型模板的映射写入输出文件旁的 .templates.json，
+    记录中只保留 style，下游按 style 查找对应的模板内容。
+
+    Args:
+        type_templates: 所有类型模板
+        style_descriptions: 风格描述字典
+        output_path: Prompt 输出文件路径
+
+    Returns:
+        旁路文件路径
+    """
+    templates_path = os.path.splitext(output_path)[0] + ".templates.json"
+    os.makedirs(os.path.dirname(templates_path), exist_ok=True)
+    templates = {
+        "style_to_type": {style: template_type_for_style(style) for style in SUPPORTED_STYLES},
+        "style_descriptions": style_descriptions,
+        "type_templates": type_templates,
+    }
+    with open(templates_path, "wb") as f:
+        f.write(orjson.dumps(templates, option=orjson.OPT_INDENT_2))
+    return templates_path
+
+
 def write_jsonl_file(data: List[Dict], output_path: str) -> None:
     """
     将数据写入 JSONL 文件（每行一个 JSON 对象）。
@@ -208,9 +355,9 @@ def write_jsonl_file(data: List[Dict], output_path: str) -> None:
     """
     output_dir = os.path.dirname(output_path)
     os.makedirs(output_dir, exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        for item in data:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    # 全部记录序列化后拼接为一个 bytes，一次写入
+    with open(output_path, "wb") as f:
+        f.write(b"".join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in data))
 
 
 # ==================== 命令行参数解析 ====================
@@ -251,6 +398,12 @@ def parse_arguments() -> argparse.Namespace:
         default=42,
         help="随机种子，用于风格选择的可复现性（默认: 42）"
     )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="生成 Prompt 的进程数，大于 1 时使用进程池并行生成（默认: 1）"
+    )
 
     return parser.parse_args()
 
@@ -271,22 +424,43 @@ def main():
     print("✅ 模板加载完成")
 
     print("\n🚀 开始生成问题合成 Prompt...")
-    generated_items = []
-    for item in tqdm(sql_data_list, desc="生成 Prompt"):
-        result = generate_prompt_for_item(
-            sql_item=item,
-            main_template=main_tmpl,
-            type_templates=type_tmpls,
-            style_descriptions=style_descs,
-            sql_engine=args.sql_engine
-        )
-        if result is not None:
-            generated_items.append(result)
+    # 风格在主进程中一次性预先抽取，结果只取决于随机种子，与进程数和调度顺序无关
+    styles = random.choices(SUPPORTED_STYLES, k=len(sql_data_list))
+    compiled_tmpls = compile_main_template(main_tmpl, type_tmpls, style_descs, args.sql_engine)
+
+    if args.num_workers > 1:
+        chunksize = max(1, len(sql_data_list) // (8 * args.num_workers))
+        with ProcessPoolExecutor(
+                max_workers=args.num_workers,
+                initializer=_init_prompt_worker,
+                initargs=(main_tmpl, type_tmpls, style_descs, args.sql_engine)
+        ) as executor:
+            results = list(tqdm(
+                executor.map(_generate_prompt_in_worker, sql_data_list, styles, chunksize=chunksize),
+                total=len(sql_data_list),
+                desc="生成 Prompt"
+            ))
+    else:
+        results = [
+            generate_prompt_for_item(
+                sql_item=item,
+                main_template=main_tmpl,
+                type_templates=type_tmpls,
+                style_descriptions=style_descs,
+                sql_engine=args.sql_engine,
+                selected_style=style,
+                compiled_templates=compiled_tmpls
+            )
+            for item, style in tqdm(zip(sql_data_list, styles), total=len(sql_data_list), desc="生成 Prompt")
+        ]
+    generated_items = [result for result in results if result is not None]
 
     print(f"✅ 成功生成 {len(generated_items)} 个有效 Prompt")
 
     print(f"\n💾 正在保存结果到: {args.output_file}")
     write_jsonl_file(generated_items, args.output_file)
+    templates_path = write_templates_file(type_tmpls, style_descs, args.output_file)
+    print(f"📄 风格与类型模板已保存到: {templates_path}")
     print("✅ 保存完成！")
     print("=" * 60)
 
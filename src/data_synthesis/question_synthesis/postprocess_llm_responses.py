@@ -1,11 +1,19 @@
-import json
 import os
-import re
 import argparse
 from pathlib import Path
+from typing import Iterator
+
+import orjson
 from tqdm import tqdm
 import json_repair
 
+from jsonl_io import iter_jsonl_bytes
+
+# 思考结束标记与问题起止标记都是固定字符串，直接用 str.find 定位，不经过正则引擎
+THINK_END_TAG = "</think>"
+QUESTION_START_TAG = "[QUESTION-START]"
+QUESTION_END_TAG = "[QUESTION-END]"
+
 
 def parse_args():
     """解析命令行参数"""
@@ -22,23 +30,35 @@ def parse_structured_response_from_content(content: str) -> dict | None:
     从 LLM 响应文本中解析出结构化的 JSON 对象。
     支持跳过 <think>...</think> 等思考标记，尝试修复并加载 JSON 内容。
     """
-    # 移除思考部分（兼容不同格式）
-    if "</think>" in content:
-        match = re.search(r"</think>(.*?)$", content, re.DOTALL)
-        if match:
-            content = match.group(1).strip()
-        else:
-            content = ""  # 无法提取有效内容
+    # 移除思考部分（取第一个 </think> 之后的内容）
+    think_end = content.find(THINK_END_TAG)
+    if think_end >= 0:
+        content = content[think_end + len(THINK_END_TAG):].strip()
 
     if not content:
         return None
 
-    try:
-        return re.search("\[QUESTION-START\](.*?)\[QUESTION-END\]", content, re.DOTALL).group(1).strip()
-    except Exception:
-        pass  # 忽略解析失败
+    # 提取第一对问题起止标记之间的内容
+    start = content.find(QUESTION_START_TAG)
+    if start < 0:
+        return None
+    start += len(QUESTION_START_TAG)
+    end = content.find(QUESTION_END_TAG, start)
+    if end < 0:
+        return None
+    return content[start:end].strip()
+
 
-    return None
+def _walk_jsonl(root: str) -> Iterator[str]:
+    """基于 os.scandir 递归遍历目录，按文件名后缀筛选 .jsonl 文件（利用目录项自带的类型信息，免去逐项 stat）"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".jsonl"):
+                    yield entry.path
 
 
 def load_all_responses(input_dir: str) -> list:
@@ -48,17 +68,13 @@ def load_all_responses(input_dir: str) -> list:
     if not input_path.exists():
         raise FileNotFoundError(f"输入目录不存在: {input_dir}")
 
-    for file_path in input_path.rglob("*.jsonl"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                    responses.append(data)
-                except json.JSONDecodeError:
-                    continue  # 跳过损坏行
+    for file_path in _walk_jsonl(str(input_path)):
+        # 分块读取并按换行符切分（空行已跳过），纯空白行交给 orjson 解析失败后跳过
+        for line in iter_jsonl_bytes(file_path):
+            try:
+                responses.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                continue  # 跳过损坏行或空白行
     return responses
 
 
@@ -95,9 +111,8 @@ def main():
         processed_responses.append(record)
 
     # 3. 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for data in processed_responses:
-            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+    with open(output_path, "wb") as f:
+        f.write(b"".join(orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE) for data in processed_responses))
 
     # 4. 输出统计信息
     success_count = len(processed_responses)
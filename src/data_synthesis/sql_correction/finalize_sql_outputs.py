@@ -1,10 +1,17 @@
-import json
 import argparse
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import sqlite3
 import contextlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, repeat
+
+import orjson
+from tqdm import tqdm
+
+from jsonl_io import iter_jsonl_bytes
 
 
 def parse_args():
@@ -37,8 +44,14 @@ def parse_args():
     parser.add_argument(
         "--batch_size",
         type=int,
+        default=100,
+        help="每批验证的记录数，每批结束后更新一次进度条（并行验证时每批记录由线程池并发执行）"
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
         default=1,
-        help="每处理多少条记录后显示进度"
+        help="并行验证 SQL 的线程数，每个线程使用独立的只读数据库连接（默认: 1，即串行）"
     )
     parser.add_argument(
         "--sql_timeout",
@@ -46,21 +59,36 @@ def parse_args():
         default=3.0,
         help="SQL执行超时时间（秒）"
     )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="逐条打印验证结果及失败的 SQL（默认只显示进度条）"
+    )
     return parser.parse_args()
 
 
-def load_jsonl(file_path: Path) -> List[Dict[str, Any]]:
-    """从 JSONL 文件加载记录，跳过无效行"""
-    records = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
-    return records
+def load_jsonl(file_path: Path) -> Iterator[Dict[str, Any]]:
+    """从 JSONL 文件逐条读取记录（生成器，不在内存中保留全部记录），跳过无效行"""
+    # 分块读取并按换行符切分（空行已跳过），orjson 直接解析 bytes
+    for line in iter_jsonl_bytes(file_path):
+        try:
+            yield orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue  # 纯空白行或损坏行
+
+
+def open_readonly_connection(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    以只读模式打开数据库：写操作由 SQLite 直接拒绝，验证时无需再为每条 SQL 开启并回滚事务。
+    不使用 immutable=1：该参数会忽略 -wal 文件，未检查点的已提交数据将不可见。
+    """
+    db_uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(db_uri, uri=True, check_same_thread=check_same_thread)
+    conn.isolation_level = None  # 自动提交模式，不隐式开启事务
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")  # 256 MB 页缓存
+    return conn
 
 
 @contextlib.contextmanager
@@ -70,102 +98,146 @@ def get_db_connection(db_path: str):
     """
     conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        conn.isolation_level = None  # 开启自动事务管理
+        conn = open_readonly_connection(db_path)
         yield conn
     finally:
         if conn:
             conn.close()
 
 
-def validate_sql_execution(conn: sqlite3.Connection, sql: str, timeout_seconds: float) -> Dict[str, Any]:
+# 验证线程各自持有的只读连接（连接不能跨线程并发使用）
+_worker_local = threading.local()
+
+
+def _init_worker_connection(db_path: str, opened_connections: List[sqlite3.Connection]):
+    """线程池初始化函数：为当前线程打开独立的只读连接及复用的游标，并登记以便结束时统一关闭"""
+    # 连接最终由主线程关闭（同时释放其上的游标），因此关闭线程检查
+    conn = open_readonly_connection(db_path, check_same_thread=False)
+    _worker_local.cursor = conn.cursor()
+    opened_connections.append(conn)
+
+
+def _validate_in_worker(sql: str, timeout_seconds: float) -> Dict[str, Any]:
+    """在验证线程中使用该线程自己的连接和游标执行验证"""
+    return validate_sql_execution(_worker_local.cursor, sql, timeout_seconds)
+
+
+class QueryWatchdog:
+    """
+    SQL 超时监控：由一个后台线程统一等待各连接上正在执行的语句的截止时间，到期后调用 conn.interrupt() 中断。
+    执行期间不再每隔若干虚拟机指令回调 Python 检查时间，多线程并行验证时也不会为此反复争抢 GIL；
+    所有语句共用这一个线程，不为每条语句单独创建定时器线程。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._deadlines: Dict[sqlite3.Connection, float] = {}
+        self._timed_out = set()
+        threading.Thread(target=self._run, name="sql-timeout-watchdog", daemon=True).start()
+
+    def watch(self, conn: sqlite3.Connection, timeout_seconds: float):
+        """登记连接上即将执行的语句的截止时间"""
+        deadline = time.monotonic() + timeout_seconds
+        with self._cond:
+            # 只有新的截止时间早于监控线程当前等待的时间时才需要唤醒它
+            wake = not self._deadlines or deadline < min(self._deadlines.values())
+            self._deadlines[conn] = deadline
+            if wake:
+                self._cond.notify()
+
+    def timed_out(self, conn: sqlite3.Connection) -> bool:
+        """该连接上的语句是否因超时被中断"""
+        with self._cond:
+            return conn in self._timed_out
+
+    def release(self, conn: sqlite3.Connection):
+        """语句结束（游标已关闭）后注销该连接"""
+        with self._cond:
+            self._deadlines.pop(conn, None)
+            self._timed_out.discard(conn)
+
+    def _run(self):
+        with self._cond:
+            while True:
+                if not self._deadlines:
+                    self._cond.wait()
+                    continue
+                conn, deadline = min(self._deadlines.items(), key=lambda item: item[1])
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                # 在锁内标记并中断，保证只会中断仍处于登记状态的语句
+                self._timed_out.add(conn)
+                del self._deadlines[conn]
+                conn.interrupt()
+
+
+_query_watchdog: Optional[QueryWatchdog] = None
+_query_watchdog_lock = threading.Lock()
+
+
+def get_query_watchdog() -> QueryWatchdog:
+    """获取进程内共用的 SQL 超时监控（首次使用时启动监控线程）"""
+    global _query_watchdog
+    with _query_watchdog_lock:
+        if _query_watchdog is None:
+            _query_watchdog = QueryWatchdog()
+        return _query_watchdog
+
+
+def validate_sql_execution(cursor: sqlite3.Cursor, sql: str, timeout_seconds: float) -> Dict[str, Any]:
     """
     验证SQL语句是否可以在数据库中执行成功，带超时控制
 
     Args:
-        conn: 数据库连接对象
+        cursor: 数据库游标（可在多条语句间复用，下一次 execute 会重置上一条语句）
         sql: 要验证的SQL语句
         timeout_seconds: 查询超时时间（秒）
 
     Returns:
         Dict包含验证结果信息
     """
-    # 设置进度处理函数
-    start_time = time.time()
-    timeout_occurred = False
-
-    def progress_handler():
-        nonlocal timeout_occurred
-        if time.time() - start_time > timeout_seconds:
-            timeout_occurred = True
-            return 1  # 非零值会中断查询
-        return 0
-
-    cursor = None
+    conn = cursor.connection
+    watchdog = get_query_watchdog()
+    # 登记截止时间，超时后由监控线程中断该连接上的语句
+    watchdog.watch(conn, timeout_seconds)
     try:
-        # 设置进度处理程序，每1000个虚拟机指令调用一次
-        conn.set_progress_handler(progress_handler, 1000)
-
-        cursor = conn.cursor()
-        # 开始事务
-        cursor.execute("BEGIN")
-
-        try:
-            # 执行SQL语句
-            cursor.execute(sql)
-
-            # 显式回滚，确保不修改数据库
-            conn.rollback()
-
-            return {
-                "success": True,
-                "error": None,
-                "timeout": False
-            }
-
-        except sqlite3.Error as e:
-            # 检查是否是超时导致的错误
-            if timeout_occurred:
-                return {
-                    "success": False,
-                    "error": f"Query timed out after {timeout_seconds} seconds",
-                    "timeout": True
-                }
-
-            # 执行出错，回滚事务
-            try:
-                cursor.execute("ROLLBACK")
-            except:
-                pass
-
+        # 连接为只读，无需事务与回滚：执行一次即可
+        cursor.execute(sql)
+        return {"success": True, "error": None, "timeout": False}
+    except sqlite3.Error as e:
+        # 检查是否是超时导致的中断
+        if watchdog.timed_out(conn):
             return {
                 "success": False,
-                "error": str(e),
-                "timeout": False
+                "error": f"Query timed out after {timeout_seconds} seconds",
+                "timeout": True
             }
-
+        return {"success": False, "error": str(e), "timeout": False}
     except Exception as e:
         # 其他错误
-        return {
-            "success": False,
-            "error": f"Execution error: {str(e)}",
-            "timeout": False
-        }
+        return {"success": False, "error": f"Execution error: {str(e)}", "timeout": False}
     finally:
-        if cursor:
-            cursor.close()
-        # 移除进度处理程序
-        conn.set_progress_handler(None, 0)
-
-
-def validate_sql_batch(conn: sqlite3.Connection, records: List[Dict[str, Any]], timeout_seconds: float) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        # 语句已结束，注销截止时间
+        watchdog.release(conn)
+
+def validate_sql_batch(
+    conn: sqlite3.Connection,
+    records: List[Dict[str, Any]],
+    timeout_seconds: float,
+    executor: Optional[ThreadPoolExecutor] = None,
+    verbose: bool = False
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     """
     批量验证SQL语句，返回成功和失败的记录
 
     Args:
-        conn: 数据库连接
+        conn: 数据库连接（串行验证时使用）
         records: 要验证的记录列表
         timeout_seconds: SQL执行超时时间（秒）
+        executor: 由 _init_worker_connection 初始化的线程池；提供时并发验证，结果仍按记录顺序处理
+        verbose: 是否逐条打印验证结果及失败的 SQL
 
     Returns:
         Tuple[成功记录列表, 失败记录列表]
@@ -173,58 +245,65 @@ def validate_sql_batch(conn: sqlite3.Connection, records: List[Dict[str, Any]],
     success_records = []
     failed_records = []
 
-    for i, data in enumerate(records):
-        generated_sql = data.get('structured_response', '')
+    generated_sqls = [data.get('structured_response', '') for data in records]
+    if executor is not None:
+        # 各线程使用自己的只读连接并发执行，map 按提交顺序返回结果
+        valid_sqls = [sql for sql in generated_sqls if sql]
+        validation_results = iter(executor.map(_validate_in_worker, valid_sqls, repeat(timeout_seconds)))
+        cursor = None
+    else:
+        validation_results = None
+        # 串行验证时整批复用同一个游标，批次结束后关闭
+        cursor = conn.cursor()
 
+    for i, (data, generated_sql) in enumerate(zip(records, generated_sqls)):
         if not generated_sql:
-            print(f"记录 {i} 缺少 SQL 语句，跳过")
+            if verbose:
+                print(f"记录 {i} 缺少 SQL 语句，跳过")
             continue
 
-        # 创建记录的副本以避免修改原始数据
-        record_copy = data.copy()
-
         # 执行验证，传入超时参数
-        validation_result = validate_sql_execution(conn, generated_sql, timeout_seconds)
+        if validation_results is not None:
+            validation_result = next(validation_results)
+        else:
+            validation_result = validate_sql_execution(cursor, generated_sql, timeout_seconds)
+
+        # 原始记录验证后不再使用，直接原地修改，不再复制
+        # 删除不需要的字段
+        for key in ('model_name', 'generated_content', 'structured_response'):
+            data.pop(key, None)
 
         if validation_result['success']:
             # 成功记录的处理
-            record_copy['synthesis_sql'] = generated_sql
-
-            # 删除不需要的字段 prompt_id
-            for key in ['model_name', 'generated_content', 'structured_response']:
-                if key in record_copy:
-                    del record_copy[key]
-
-            success_records.append(record_copy)
-            print(f"记录 {i} SQL 执行成功")
+            data['synthesis_sql'] = generated_sql
+            success_records.append(data)
+            if verbose:
+                print(f"记录 {i} SQL 执行成功")
         else:
-            # 删除不需要的字段 prompt_id
-            for key in ['model_name', 'generated_content', 'structured_response']:
-                if key in record_copy:
-                    del record_copy[key]
-
             # 失败记录的处理
-            error_msg = f"{validation_result['error']}"
-            print(f"记录 {i} {error_msg}")
-            print(f"失败SQL: {generated_sql}")
+            if verbose:
+                print(f"记录 {i} {validation_result['error']}")
+                print(f"失败SQL: {generated_sql}")
 
             # 为失败记录添加错误信息
-            record_copy['validation_error'] = {
+            data['validation_error'] = {
                 'error_message': validation_result['error'],
                 'timeout': validation_result.get('timeout', False),
                 'sql': generated_sql
             }
-            failed_records.append(record_copy)
+            failed_records.append(data)
+
+    if cursor is not None:
+        cursor.close()
 
     return success_records, failed_records
 
 
-def save_records_to_jsonl(records: List[Dict[str, Any]], file_path: Path):
-    """将记录保存到JSONL文件"""
-    with open(file_path, "w", encoding="utf-8") as f:
-        for record in records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-            f.flush()
+def save_records_to_jsonl(records: List[Dict[str, Any]], f):
+    """将一批记录追加写入已打开的 JSONL 文件（二进制模式）"""
+    # 整批记录拼接为一个 bytes 一次写入，不再逐条 flush
+    if records:
+        f.write(b"".join(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in records))
 
 
 def main():
@@ -242,45 +321,60 @@ def main():
     success_output_path.parent.mkdir(parents=True, exist_ok=True)
     failed_output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 1. 加载原始记录
-    records = load_jsonl(input_path)
-    print(f"共加载 {len(records)} 条后处理记录")
-
-    # 2. 验证数据库文件是否存在
+    # 1. 验证数据库文件是否存在
     if not Path(args.db_path).exists():
         raise FileNotFoundError(f"数据库文件不存在: {args.db_path}")
 
     print(f"使用数据库: {args.db_path}")
     print(f"SQL执行超时设置: {args.sql_timeout} 秒")
 
-    success_records = []
-    failed_records = []
-
-    # 3. 使用单一数据库连接批量验证所有SQL
-    with get_db_connection(args.db_path) as conn:
-        print("开始批量验证SQL语句...")
-
-        # 批量处理，显示进度
-        total = len(records)
-        for i in range(0, total, args.batch_size):
-            batch = records[i:i + args.batch_size]
-            print(f"处理进度: {i}-{min(i + args.batch_size, total)}/{total}")
-
-            batch_success, batch_failed = validate_sql_batch(conn, batch, args.sql_timeout)
-            success_records.extend(batch_success)
-            failed_records.extend(batch_failed)
+    total = 0
+    success_count = 0
+    failed_count = 0
+
+    # 2. 批量验证所有SQL：串行时使用单一数据库连接，并行时每个线程各用一个只读连接
+    executor = None
+    worker_connections: List[sqlite3.Connection] = []
+    if args.num_workers > 1:
+        executor = ThreadPoolExecutor(
+            max_workers=args.num_workers,
+            initializer=_init_worker_connection,
+            initargs=(args.db_path, worker_connections)
+        )
+        print(f"并行验证线程数: {args.num_workers}")
 
-    # 保存成功记录
-    save_records_to_jsonl(success_records, success_output_path)
-
-    # 保存失败记录
-    save_records_to_jsonl(failed_records, failed_output_path)
+    try:
+        with contextlib.ExitStack() as stack:
+            conn = stack.enter_context(get_db_connection(args.db_path))
+            success_f = stack.enter_context(open(success_output_path, "wb"))
+            failed_f = stack.enter_context(open(failed_output_path, "wb"))
+            print("开始批量验证SQL语句...")
+
+            # 3. 流式处理：逐批读取输入、验证并立即写出结果，内存中只保留当前批次
+            records = load_jsonl(input_path)
+            with tqdm(desc="验证SQL", unit="条") as pbar:
+                while batch := list(islice(records, args.batch_size)):
+                    batch_success, batch_failed = validate_sql_batch(
+                        conn, batch, args.sql_timeout, executor, verbose=args.verbose
+                    )
+                    save_records_to_jsonl(batch_success, success_f)
+                    save_records_to_jsonl(batch_failed, failed_f)
+
+                    total += len(batch)
+                    success_count += len(batch_success)
+                    failed_count += len(batch_failed)
+                    pbar.update(len(batch))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            for worker_conn in worker_connections:
+                worker_conn.close()
 
     # 输出统计信息
     print(f"\n✅ 数据生成完成！")
-    print(f"  输入记录数: {len(records)}")
-    print(f"  验证成功: {len(success_records)}")
-    print(f"  验证失败: {len(failed_records)}")
+    print(f"  输入记录数: {total}")
+    print(f"  验证成功: {success_count}")
+    print(f"  验证失败: {failed_count}")
     print(f"  成功记录已保存至: {success_output_path}")
     print(f"  失败记录已保存至: {failed_output_path}")
 
@@ -1,17 +1,22 @@
-import json
 import os
 import argparse
 from typing import List, Dict, Any
 
+import orjson
+
+from jsonl_io import iter_jsonl_bytes
+
 
 def load_jsonl(file_path: str) -> List[Dict[str, Any]]:
     """从 JSONL 文件加载数据"""
     data = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data.append(json.loads(line))
+    # 分块读取并按换行符切分，orjson 直接解析 bytes
+    for line in iter_jsonl_bytes(file_path):
+        try:
+            data.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            if line.strip():
+                raise  # 纯空白行跳过，真正损坏的行仍报错
     return data
 
 
@@ -28,28 +33,41 @@ def ensure_string_schema(schema) -> str:
     return str(schema)
 
 
+# 模板中的占位符 -> format 字段名
+TEMPLATE_PLACEHOLDERS = {
+    "[SQL语句内容]": "sql",
+    "[错误信息内容]": "error_message",
+    "{{schema}}": "schema",  # 大括号转义后的形式
+}
+
+
+def compile_correction_template(template: str) -> str:
+    """
+    将 prompt 模板转换为 str.format 模板（只需执行一次）：
+    先转义模板中原有的大括号，再把占位符替换为对应的 format 字段
+    """
+    compiled = template.replace("{", "{{").replace("}", "}}")
+    for placeholder, field in TEMPLATE_PLACEHOLDERS.items():
+        compiled = compiled.replace(placeholder, "{" + field + "}")
+    return compiled
+
+
 def generate_correction_prompt(
     template: str,
     sql: str,
     error_message: str,
     schema: str
 ) -> str:
-    """根据模板生成 SQL 修正 prompt"""
-    return (
-        template
-        .replace("[SQL语句内容]", sql)
-        .replace("[错误信息内容]", error_message)
-        .replace("{schema}", schema)
-    )
+    """根据 compile_correction_template 转换后的模板生成 SQL 修正 prompt（单次遍历模板完成全部替换）"""
+    return template.format_map({"sql": sql, "error_message": error_message, "schema": schema})
 
 
 def save_jsonl(data: List[Dict], output_path: str) -> None:
     """将数据保存为 JSONL 格式"""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        for item in data:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-            f.flush()
+    # 全部记录拼接为一个 bytes 一次写入，不再逐条 flush
+    with open(output_path, "wb") as f:
+        f.write(b"".join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in data))
 
 
 def main():
@@ -81,7 +99,7 @@ def main():
     print(f"共加载 {len(failed_cases)} 条失败记录")
 
     # 2. 加载 prompt 模板
-    prompt_template = load_prompt_template(args.prompt_template)
+    prompt_template = compile_correction_template(load_prompt_template(args.prompt_template))
 
     # 3. 为每条记录生成修正 prompt
     print("正在生成修正 prompt...")
@@ -0,0 +1,37 @@
+from typing import Iterator
+
+
+def iter_jsonl_bytes(path, bufsize: int = 1 << 21) -> Iterator[bytes]:
+    """
+    以固定大小的二进制块读取文件，并用 bytes.find 查找换行符切分出每一行（不含换行符）。
+    相比逐行迭代文件对象，省去了逐行的缓冲区检查和 strip 副本；每个块只扫描一次，
+    跨块的未结束行先按块暂存，遇到换行符时再拼接，超过 bufsize 的长行也不会被反复复制和扫描。
+    空行直接跳过；纯空白行交给 orjson 解析失败后跳过。
+    """
+    with open(path, "rb", buffering=0) as f:
+        tail = []  # 尚未遇到换行符的行片段
+        while True:
+            chunk = f.read(bufsize)
+            if not chunk:
+                break
+            nl = chunk.find(b"\n")
+            if nl == -1:
+                tail.append(chunk)
+                continue
+            if tail:
+                tail.append(chunk[:nl])
+                yield b"".join(tail)
+                tail = []
+            elif nl > 0:
+                yield chunk[:nl]
+            start = nl + 1
+            while (nl := chunk.find(b"\n", start)) != -1:
+                if nl > start:
+                    yield chunk[start:nl]
+                start = nl + 1
+            if start < len(chunk):
+                tail.append(chunk[start:])
+        if tail:
+            line = b"".join(tail)
+            if line.strip():
+                yield line
@@ -1,4 +1,3 @@
-import json
 import argparse
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -6,6 +5,10 @@ import sqlite3
 import contextlib
 import time
 
+import orjson
+
+from jsonl_io import iter_jsonl_bytes
+
 
 def parse_args():
     """解析命令行参数"""
@@ -28,14 +31,12 @@ def parse_args():
 def load_jsonl(file_path: Path) -> List[Dict[str, Any]]:
     """从 JSONL 文件加载记录，跳过无效行"""
     records = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    records.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
+    # 分块读取并按换行符切分（空行已跳过），orjson 直接解析 bytes
+    for line in iter_jsonl_bytes(file_path):
+        try:
+            records.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            continue  # 纯空白行或损坏行
     return records
 
 
@@ -53,36 +54,32 @@ def main():
     records = load_jsonl(input_path)
     print(f"共加载 {len(records)} 条后处理记录")
 
-    final_records = []
-
+    # 过滤、删除字段与序列化在同一遍中完成，直接拼接为待写出的 bytes
+    final_count = 0
+    buf = bytearray()
     for record in records:
         structured_response = record['structured_response']
 
-        is_requirement_matched = structured_response['is_requirement_matched']
-        mismatch_details = structured_response['mismatch_details']
-
-        if len(mismatch_details)>0:
-            continue
-        if is_requirement_matched is False:
+        # 先判断廉价的布尔值，再判断不一致详情是否非空
+        if structured_response['is_requirement_matched'] is False or structured_response['mismatch_details']:
             continue
 
-        del record['structured_response']
-        del record['generated_content']
-        del record['model_name']
+        for key in ('structured_response', 'generated_content', 'model_name'):
+            record.pop(key, None)
 
-        final_records.append(record)
+        buf += orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        final_count += 1
 
     # 保存结果
-    with open(output_path, "w", encoding="utf-8") as f:
-        for record in final_records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    with open(output_path, "wb") as f:
+        f.write(buf)
 
     # 输出统计信息
     print(f"\n✅ 最终数据生成完成！")
     print(f"  输入记录数: {len(records)}")
-    print(f"  验证成功: {len(final_records)}")
-    print(f"  验证失败: {len(records) - len(final_records)}")
-    print(f"  最终输出记录数: {len(final_records)}")
+    print(f"  验证成功: {final_count}")
+    print(f"  验证失败: {len(records) - final_count}")
+    print(f"  最终输出记录数: {final_count}")
     print(f"  结果已保存至: {output_path}")
 
 
@@ -1,20 +1,31 @@
-import json
 import os
 import argparse
+import contextlib
 from tqdm import tqdm
-from typing import List, Dict, Optional
-import copy
+from typing import Dict, Iterator, Optional, Tuple
 
+import orjson
 
-def load_jsonl_data(file_path: str) -> List[Dict]:
-    """从 JSONL 文件中加载数据"""
-    data_list = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data_list.append(json.loads(line))
-    return data_list
+from jsonl_io import iter_jsonl_bytes
+
+# 嵌入 prompt 的 JSON 片段：两空格缩进，与 json.dumps(indent=2, ensure_ascii=False) 格式一致
+INDENTED_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# 各模板中的占位符（形如 {db_type}），加载时转换为 str.format 字段
+STATIC_TEMPLATE_FIELDS = ("db_type", "database_schema", "user_query", "generated_sql")
+DYNAMIC_TEMPLATE_FIELDS = ("db_type", "table_schemas", "column_values", "user_query", "generated_sql")
+
+
+def iter_jsonl(file_path: str) -> Iterator[Dict]:
+    """逐行读取 JSONL 文件（生成器，不在内存中保留全部数据），跳过空行和纯空白行"""
+    for line in iter_jsonl_bytes(file_path):
+        try:
+            item = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            if line.strip():
+                raise
+            continue  # 纯空白行
+        yield item
 
 
 def load_prompt_template(template_path: str) -> str:
@@ -28,20 +39,31 @@ def load_prompt_template(template_path: str) -> str:
         raise RuntimeError(f"加载模板失败 ({template_path}): {e}")
 
 
+def compile_template(template: str, fields: Tuple[str, ...]) -> str:
+    """
+    将 prompt 模板转换为 str.format 模板（只需执行一次）：
+    先转义模板中原有的大括号（如 JSON 示例），再把占位符还原为对应的 format 字段
+    """
+    compiled = template.replace("{", "{{").replace("}", "}}")
+    for field in fields:
+        compiled = compiled.replace("{{" + field + "}}", "{" + field + "}")
+    return compiled
+
+
 def generate_static_matching_item(item: Dict, template: str) -> Dict:
-    """为单个条目生成静态需求匹配数据"""
+    """为单个条目生成静态需求匹配数据（template 为 compile_template 转换后的模板）"""
     synthesis_question = item['synthesis_question']
     synthesis_sql = item['synthesis_sql']
     schema = item['question_synthesis_metadata']['schema']
     engine = item['question_synthesis_metadata']['engine']
 
-    filled_prompt = (
-        template
-        .replace("{db_type}", engine)
-        .replace("{database_schema}", schema)
-        .replace("{user_query}", synthesis_question)
-        .replace("{generated_sql}", synthesis_sql)
-    )
+    # 单次遍历模板完成全部替换
+    filled_prompt = template.format_map({
+        "db_type": engine,
+        "database_schema": schema,
+        "user_query": synthesis_question,
+        "generated_sql": synthesis_sql,
+    })
 
     static_matching = {
         "prompt": filled_prompt,
@@ -50,13 +72,12 @@ def generate_static_matching_item(item: Dict, template: str) -> Dict:
         "schema": schema
     }
 
-    result_item = copy.deepcopy(item)
-    result_item["static_requirement_matching"] = static_matching
-    return result_item
+    # 原始条目不会再被修改，浅拷贝并追加新字段即可
+    return {**item, "static_requirement_matching": static_matching}
 
 
 def generate_dynamic_matching_item(item: Dict, template: str) -> Optional[Dict]:
-    """为单个条目生成动态需求匹配数据（若样本数据存在）"""
+    """为单个条目生成动态需求匹配数据（若样本数据存在；template 为 compile_template 转换后的模板）"""
     synthesis_question = item['synthesis_question']
     synthesis_sql = item['synthesis_sql']
     schema = item['question_synthesis_metadata']['schema']
@@ -67,14 +88,14 @@ def generate_dynamic_matching_item(item: Dict, template: str) -> Optional[Dict]:
     except KeyError:
         return None  # 缺少样本数据，跳过
 
-    filled_prompt = (
-        template
-        .replace("{db_type}", engine)
-        .replace("{table_schemas}", schema)
-        .replace("{column_values}", json.dumps(sample_data, ensure_ascii=False, indent=2))
-        .replace("{user_query}", synthesis_question)
-        .replace("{generated_sql}", synthesis_sql)
-    )
+    # 单次遍历模板完成全部替换
+    filled_prompt = template.format_map({
+        "db_type": engine,
+        "table_schemas": schema,
+        "column_values": orjson.dumps(sample_data, option=INDENTED_JSON_OPTIONS).decode(),
+        "user_query": synthesis_question,
+        "generated_sql": synthesis_sql,
+    })
 
     dynamic_matching = {
         "prompt": filled_prompt,
@@ -84,21 +105,13 @@ def generate_dynamic_matching_item(item: Dict, template: str) -> Optional[Dict]:
         "sample_data": sample_data
     }
 
-    result_item = copy.deepcopy(item)
-    result_item["dynamic_requirement_matching"] = dynamic_matching
-    return result_item
+    # 原始条目不会再被修改，浅拷贝并追加新字段即可
+    return {**item, "dynamic_requirement_matching": dynamic_matching}
 
 
-def save_as_jsonl(data: List[Dict], output_path: str) -> None:
-    """将数据保存为 JSONL 格式（每行一个 JSON 对象）"""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            for item in data:
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
-        print(f"数据已保存至: {output_path}（共 {len(data)} 条）")
-    except Exception as e:
-        print(f"保存文件失败 ({output_path}): {e}")
+def write_jsonl_line(f, item: Dict) -> None:
+    """将单条数据以 JSONL 格式写入已打开的文件（二进制模式）"""
+    f.write(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE))
 
 
 def main():
@@ -145,34 +158,46 @@ def main():
     static_output_path = os.path.join(args.output_dir, "static_requirement_matching.jsonl") if use_static else None
     dynamic_output_path = os.path.join(args.output_dir, "dynamic_requirement_matching.jsonl") if use_dynamic else None
 
-    # 加载数据
-    print("正在读取原始数据...")
-    raw_data = load_jsonl_data(args.input_file)
-    print(f"原始数据加载完成，共 {len(raw_data)} 条")
-
-    # 按需加载模板
-    static_template = load_prompt_template(args.static_template) if use_static else None
-    dynamic_template = load_prompt_template(args.dynamic_template) if use_dynamic else None
+    # 按需加载并编译模板
+    static_template = (
+        compile_template(load_prompt_template(args.static_template), STATIC_TEMPLATE_FIELDS) if use_static else None
+    )
+    dynamic_template = (
+        compile_template(load_prompt_template(args.dynamic_template), DYNAMIC_TEMPLATE_FIELDS) if use_dynamic else None
+    )
 
-    # 初始化结果列表
-    static_items = []
-    dynamic_items = []
+    # 流式处理：逐条读取原始数据，生成结果后立即写出，不保留中间列表
+    os.makedirs(args.output_dir, exist_ok=True)
+    total_count = 0
+    static_count = 0
+    dynamic_count = 0
 
-    # 处理每一条数据
     print("正在生成匹配数据...")
-    for item in tqdm(raw_data, desc="处理条目"):
-        if use_static:
-            static_items.append(generate_static_matching_item(item, static_template))
-        if use_dynamic:
-            dynamic_item = generate_dynamic_matching_item(item, dynamic_template)
-            if dynamic_item is not None:
-                dynamic_items.append(dynamic_item)
-
-    # 按需保存
-    if static_items:
-        save_as_jsonl(static_items, static_output_path)
-    if dynamic_items:
-        save_as_jsonl(dynamic_items, dynamic_output_path)
+    # 输出文件在写入第一条数据时才创建，没有符合条件的条目时不生成文件
+    with contextlib.ExitStack() as stack:
+        static_f = None
+        dynamic_f = None
+
+        for item in tqdm(iter_jsonl(args.input_file), desc="处理条目"):
+            total_count += 1
+            if use_static:
+                if static_f is None:
+                    static_f = stack.enter_context(open(static_output_path, "wb"))
+                write_jsonl_line(static_f, generate_static_matching_item(item, static_template))
+                static_count += 1
+            if use_dynamic:
+                dynamic_item = generate_dynamic_matching_item(item, dynamic_template)
+                if dynamic_item is not None:
+                    if dynamic_f is None:
+                        dynamic_f = stack.enter_context(open(dynamic_output_path, "wb"))
+                    write_jsonl_line(dynamic_f, dynamic_item)
+                    dynamic_count += 1
+
+    print(f"原始数据共 {total_count} 条")
+    if static_count:
+        print(f"数据已保存至: {static_output_path}（共 {static_count} 条）")
+    if dynamic_count:
+        print(f"数据已保存至: {dynamic_output_path}（共 {dynamic_count} 条）")
 
 
 if __name__ == "__main__":
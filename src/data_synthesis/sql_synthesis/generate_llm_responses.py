@@ -41,17 +41,22 @@ def get_output_filename(save_dir: str) -> str:
     return str(save_path / f"{timestamp}.jsonl")
 
 
-def get_nested_value(data: dict, field_path: str):
+def compile_field_path(field_path: str) -> list:
+    """将点号分隔的字段路径预先拆分为访问键列表，数字段转为整数（支持数组索引，如 messages.0.content）"""
+    return [int(key) if key.isdigit() else key for key in field_path.split('.')]
+
+
+def get_nested_value(data: dict, field_path: str, keys: list = None):
     """
     根据点号分隔的字段路径（如 'prompt_context.filled'）从嵌套字典中安全获取值。
+    keys 为 compile_field_path 预先拆分好的访问键，逐条取值时传入可省去重复拆分路径。
     若路径不存在，抛出 KeyError 并提示字段缺失。
     """
-    keys = field_path.split('.')
+    if keys is None:
+        keys = compile_field_path(field_path)
     current = data
     try:
         for key in keys:
-            if key.isdigit():  # 支持数组索引，如 messages.0.content
-                key = int(key)
             current = current[key]
         return current
     except (KeyError, IndexError, TypeError) as e:
@@ -150,9 +155,11 @@ def filter_unprocessed_items(original_data: list, output_dir: str, id_fields: li
 def extract_prompts(data_list: list, prompt_field: str) -> list:
     """根据指定字段路径从数据列表中提取 prompt 文本"""
     prompts = []
+    # 字段路径只拆分一次，所有数据项复用
+    keys = compile_field_path(prompt_field)
     for item in data_list:
         try:
-            prompt_text = get_nested_value(item, prompt_field)
+            prompt_text = get_nested_value(item, prompt_field, keys)
             prompts.append(prompt_text)
         except KeyError as e:
             raise KeyError(f"无法提取 prompt：{e}")
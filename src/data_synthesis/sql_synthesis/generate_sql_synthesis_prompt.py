@@ -1,13 +1,22 @@
-import copy
-import json
 import random
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 
 import numpy as np
+import orjson
 from tqdm import tqdm
 
+from jsonl_io import iter_jsonl_bytes
+
+# 嵌入 prompt 的 JSON 片段：两空格缩进，与 json.dumps(indent=2, ensure_ascii=False) 格式一致
+INDENTED_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# 主模板中随每个样本变化的占位符；其余占位符（complexity、criterion、db_engine）按复杂度预先填入
+SAMPLE_FIELDS = ("schema_str", "sql_function_prompt", "db_value_prompt", "column_count")
+
 
 def safe_random_sample(lst, min_count, max_count):
     """在指定范围内安全地从列表中随机采样"""
@@ -38,109 +47,200 @@ def load_prompt_templates(
     return templates
 
 
-def generate_prompted_samples(
-    annotated_data: List[Dict[str, Any]],
+def _escape_braces(text: str) -> str:
+    """转义大括号，使文本在 str.format 模板中按原样输出"""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def compile_prompt_templates(templates: Dict[str, Any], db_engine: str) -> Dict[str, Any]:
+    """
+    将 load_prompt_templates 加载的模板编译为逐样本填充所用的形式（只需执行一次）：
+    主模板按复杂度各生成一个 str.format 模板，复杂度、评判标准与数据库引擎提前填入，
+    SAMPLE_FIELDS 中的占位符转换为 format 字段，每个样本只需一次 format_map。
+
+    Returns:
+        {"main": {复杂度: 编译后的主模板}, "sql_func": SQL 函数提示模板}
+    """
+    escaped = _escape_braces(templates["main"])
+    for field in SAMPLE_FIELDS:
+        escaped = escaped.replace("{{" + field + "}}", "{" + field + "}")
+
+    main_by_complexity = {}
+    for complexity, criterion in templates["criteria"].items():
+        fixed_values = {"complexity": complexity, "criterion": criterion, "db_engine": db_engine}
+        compiled = escaped
+        for field, value in fixed_values.items():
+            compiled = compiled.replace("{{" + field + "}}", _escape_braces(value))
+        main_by_complexity[complexity] = compiled
+
+    return {"main": main_by_complexity, "sql_func": templates["sql_func"]}
+
+
+def generate_samples_for_item(
+    data: Dict[str, Any],
     templates: Dict[str, Any],
     similar_table_min: int,
     similar_table_max: int,
     available_func_min: int,
     available_func_max: int,
     prompts_per_item: int,
-    db_engine: str
+    prompt_id_start: int
 ) -> List[Dict[str, Any]]:
-    """为每条结构化数据生成多个带上下文的提示样本"""
-    generated_samples = []
-    complexity_levels = list(templates["criteria"].keys())
-    prompt_id = 0
-
-    for data in tqdm(annotated_data, desc="Generating prompts"):
-        for _ in range(prompts_per_item):
-            complexity = random.choice(complexity_levels)
-
-            # 采样相似表（用于多表上下文）
-            similar_tables = data.get("similar_tables", [])
-            sampled_similar = safe_random_sample(
-                similar_tables, similar_table_min, similar_table_max
+    """
+    为单条结构化数据生成 prompts_per_item 个提示样本，prompt_id 从 prompt_id_start 开始连续编号。
+    templates 为 compile_prompt_templates 编译后的模板。
+    """
+    complexity_levels = list(templates["main"].keys())
+    samples = []
+
+    for offset in range(prompts_per_item):
+        complexity = random.choice(complexity_levels)
+
+        # 采样相似表（用于多表上下文）
+        similar_tables = data.get("similar_tables", [])
+        sampled_similar = safe_random_sample(
+            similar_tables, similar_table_min, similar_table_max
+        )
+
+        # 构建 schema 字符串列表（主表 + 相似表）
+        schemas = [data["annotated_ddl"]]
+        schemas.extend(item["annotated_ddl"] for item in sampled_similar)
+
+        # 构建样例数据（每个表取前2行）
+        sample_data = {data["table_name"]: data["sample_data"][:2]}
+        for item in sampled_similar:
+            sample_data[item["table_name"]] = item["sample_data"][:2]
+
+        # 构建可用函数列表（带中文说明）
+        available_functions = []
+        for func_name, description in data.get("function_descriptions", {}).items():
+            available_functions.append({
+                "函数名称": func_name,
+                "函数说明": description
+            })
+
+        # 生成 SQL 函数提示片段
+        sampled_funcs = []
+        if not available_functions:
+            sql_func_prompt = "**SQL 函数**\n你可以使用数据库引擎所支持的任何函数。\n"
+        else:
+            sampled_funcs = safe_random_sample(
+                available_functions, available_func_min, available_func_max
             )
+            func_json_str = orjson.dumps(sampled_funcs, option=INDENTED_JSON_OPTIONS).decode()
+            sql_func_prompt = templates["sql_func"].replace("{sql_funcs}", func_json_str)
+
+        # 使用几何分布生成目标列数（模拟真实查询复杂度）
+        target_column_count = int(np.random.geometric(p=0.6))
+
+        # 填充主提示模板
+        final_prompt = templates["main"][complexity].format_map({
+            "schema_str": "\n\n".join(schemas),
+            "sql_function_prompt": sql_func_prompt,
+            "db_value_prompt": orjson.dumps(sample_data, option=INDENTED_JSON_OPTIONS).decode(),
+            "column_count": target_column_count,
+        })
+
+        # 构建输出记录：同一条数据的各样本共享原始字段（均不会被修改），只浅拷贝顶层
+        output_record = dict(data)
+        output_record["prompt_context"] = {"filled": final_prompt}
+        output_record["prompt_context"]['metadata'] = {
+            'schema_str': schemas,
+            'sql_func_prompt': sampled_funcs,
+            'db_value_prompt': sample_data,
+        }
 
-            # 构建 schema 字符串列表（主表 + 相似表）
-            schemas = [data["annotated_ddl"]]
-            schemas.extend(item["annotated_ddl"] for item in sampled_similar)
-
-            # 构建样例数据（每个表取前2行）
-            sample_data = {data["table_name"]: data["sample_data"][:2]}
-            for item in sampled_similar:
-                sample_data[item["table_name"]] = item["sample_data"][:2]
-
-            # 构建可用函数列表（带中文说明）
-            available_functions = []
-            for func_name, description in data.get("function_descriptions", {}).items():
-                available_functions.append({
-                    "函数名称": func_name,
-                    "函数说明": description
-                })
-
-            # 生成 SQL 函数提示片段
-            sampled_funcs = []
-            if not available_functions:
-                sql_func_prompt = "**SQL 函数**\n你可以使用数据库引擎所支持的任何函数。\n"
-            else:
-                sampled_funcs = safe_random_sample(
-                    available_functions, available_func_min, available_func_max
-                )
-                func_json_str = json.dumps(sampled_funcs, ensure_ascii=False, indent=2)
-                sql_func_prompt = templates["sql_func"].replace("{sql_funcs}", func_json_str)
-
-            # 使用几何分布生成目标列数（模拟真实查询复杂度）
-            target_column_count = int(np.random.geometric(p=0.6))
-
-            # 填充主提示模板
-            final_prompt = (
-                templates["main"]
-                .replace("{schema_str}", "\n\n".join(schemas))
-                .replace("{sql_function_prompt}", sql_func_prompt)
-                .replace("{db_value_prompt}", json.dumps(sample_data, ensure_ascii=False, indent=2))
-                .replace("{complexity}", complexity)
-                .replace("{criterion}", templates["criteria"][complexity])
-                .replace("{db_engine}", db_engine)
-                .replace("{column_count}", str(target_column_count))
-            )
+        output_record["prompt_id"] = prompt_id_start + offset
+
+        samples.append(output_record)
+
+    return samples
 
-            # 构建输出记录
-            output_record = copy.deepcopy(data)
-            output_record["prompt_context"] = {"filled": final_prompt}
-            output_record["prompt_context"]['metadata'] = {
-                'schema_str': schemas,
-                'sql_func_prompt': sampled_funcs,
-                'db_value_prompt': sample_data,
-            }
 
-            output_record["prompt_id"] = prompt_id
+def _generate_item_with_seed(index: int, data: Dict[str, Any], seed: Optional[int], **kwargs) -> List[Dict[str, Any]]:
+    """
+    生成第 index 条数据的提示样本。指定 seed 时按 (seed, index) 重置随机数状态，
+    结果与进程数及任务调度顺序无关
+    """
+    if seed is not None:
+        random.seed(f"{seed}-{index}")
+        np.random.seed(random.getrandbits(32))
+    return generate_samples_for_item(data, prompt_id_start=index * kwargs["prompts_per_item"], **kwargs)
 
-            prompt_id += 1
 
-            generated_samples.append(output_record)
+# 子进程中复用的模板与采样参数，由进程池初始化函数设置一次，避免随每个任务重复序列化
+_WORKER_CONTEXT: Dict[str, Any] = {}
 
-    return generated_samples
 
+def _init_prompt_worker(context: Dict[str, Any]) -> None:
+    """进程池初始化函数：保存模板与采样参数；未指定种子时重新播种，避免各子进程继承相同的随机数状态"""
+    _WORKER_CONTEXT.update(context)
+    if context["seed"] is None:
+        random.seed()
+        np.random.seed()
 
-def load_annotated_data(input_path: Path) -> List[Dict[str, Any]]:
-    """从 JSONL 文件加载标注后的 DDL 数据"""
-    data_list = []
-    with open(input_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data_list.append(json.loads(line))
-    return data_list
 
-def save_generated_prompts(output_path: Path, samples: List[Dict[str, Any]]):
-    """将生成的提示样本保存为 JSONL 文件"""
+def _generate_item_in_worker(index: int, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """在子进程中为单条数据生成提示样本"""
+    return _generate_item_with_seed(index, data, **_WORKER_CONTEXT)
+
+
+def generate_prompted_samples(
+    annotated_data: Iterable[Dict[str, Any]],
+    templates: Dict[str, Any],
+    similar_table_min: int,
+    similar_table_max: int,
+    available_func_min: int,
+    available_func_max: int,
+    prompts_per_item: int,
+    db_engine: str,
+    num_workers: int = 1,
+    seed: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    为每条结构化数据生成多个带上下文的提示样本（生成器，逐条产出，可直接消费流式输入）。
+    num_workers > 1 时使用进程池并行生成，结果仍按输入顺序产出，prompt_id 与串行时一致。
+    """
+    context = dict(
+        templates=compile_prompt_templates(templates, db_engine),
+        similar_table_min=similar_table_min,
+        similar_table_max=similar_table_max,
+        available_func_min=available_func_min,
+        available_func_max=available_func_max,
+        prompts_per_item=prompts_per_item,
+        seed=seed,
+    )
+
+    if num_workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_prompt_worker,
+            initargs=(context,)
+        ) as executor:
+            results = executor.map(_generate_item_in_worker, count(), annotated_data, chunksize=64)
+            for samples in tqdm(results, desc="Generating prompts"):
+                yield from samples
+    else:
+        for index, data in enumerate(tqdm(annotated_data, desc="Generating prompts")):
+            yield from _generate_item_with_seed(index, data, **context)
+
+
+def iter_jsonl(input_path: Path) -> Iterator[Dict[str, Any]]:
+    """逐行读取标注后的 DDL 数据（生成器，不在内存中保留全部输入），跳过空行和纯空白行"""
+    for line in iter_jsonl_bytes(input_path):
+        try:
+            item = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            if line.strip():
+                raise
+            continue  # 纯空白行
+        yield item
+
+def save_generated_prompts(output_path: Path, lines: Iterable[bytes]):
+    """将已序列化的提示样本（每个元素为一行以换行结尾的 JSON bytes）保存为 JSONL 文件"""
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        for sample in samples:
-            f.write(json.dumps(sample, ensure_ascii=False))
-            f.write("\n")
+    with open(output_path, "wb") as f:
+        f.write(b"".join(lines))
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="基于结构化 DDL 生成 SQL 合成提示样本")
@@ -173,6 +273,12 @@ def parse_arguments():
     parser.add_argument("--available_func_min", type=int, default=4, help="函数提示最小展示数量")
     parser.add_argument("--available_func_max", type=int, default=10, help="函数提示最大展示数量")
     parser.add_argument("--prompts_per_item", type=int, default=20, help="每条数据生成的提示数量")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="采样随机种子；指定后每条数据按 (seed, 序号) 播种，结果与进程数无关（默认不固定）")
+
+    # 并行
+    parser.add_argument("--num_workers", type=int, default=1,
+                        help="并行生成提示样本的进程数（默认: 1，即串行）")
 
     # 数据库引擎
     parser.add_argument("--db_engine", type=str, default="sqlite", choices=["sqlite", "mysql", "postgresql"], help="目标数据库引擎")
@@ -188,10 +294,6 @@ def main():
     if not input_path.exists():
         raise FileNotFoundError(f"输入文件不存在: {input_path}")
 
-    # 加载数据
-    annotated_data = load_annotated_data(input_path)
-    print(f"成功加载 {len(annotated_data)} 条标注数据")
-
     # 构建 criteria 路径映射
     criteria_paths = {
         "Simple": Path(args.simple_criterion),
@@ -217,24 +319,30 @@ def main():
         criteria_template_paths=criteria_paths
     )
 
-    # 生成提示样本
-    generated_samples = generate_prompted_samples(
-        annotated_data=annotated_data,
-        templates=templates,
-        similar_table_min=args.similar_table_min,
-        similar_table_max=args.similar_table_max,
-        available_func_min=args.available_func_min,
-        available_func_max=args.available_func_max,
-        prompts_per_item=args.prompts_per_item,
-        db_engine=args.db_engine
-    )
+    # 流式读取标注数据并生成提示样本；样本生成后立即序列化，
+    # 只保留每条样本的 JSON 文本（用于最终打乱顺序），不保留嵌套的 dict 对象
+    generated_lines = [
+        orjson.dumps(sample, option=orjson.OPT_APPEND_NEWLINE)
+        for sample in generate_prompted_samples(
+            annotated_data=iter_jsonl(input_path),
+            templates=templates,
+            similar_table_min=args.similar_table_min,
+            similar_table_max=args.similar_table_max,
+            available_func_min=args.available_func_min,
+            available_func_max=args.available_func_max,
+            prompts_per_item=args.prompts_per_item,
+            db_engine=args.db_engine,
+            num_workers=args.num_workers,
+            seed=args.seed
+        )
+    ]
 
-    print(f"共生成 {len(generated_samples)} 个提示样本")
+    print(f"共生成 {len(generated_lines)} 个提示样本")
 
     random.seed(42)
-    random.shuffle(generated_samples)
+    random.shuffle(generated_lines)
     # 保存结果
-    save_generated_prompts(output_path, generated_samples)
+    save_generated_prompts(output_path, generated_lines)
     print(f"✅ 提示样本已保存至: {output_path}")
 
 
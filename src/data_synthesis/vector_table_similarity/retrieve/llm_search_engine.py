@@ -1,6 +1,7 @@
 # toolkit/retrieve/llm_search_engine.py
 import json
 import os
+from functools import lru_cache
 from typing import Any, List, Tuple, Dict, Union
 from text2sql_evaluator.toolkit.llm.vllm_client import VLLMServiceLLM
 from llama_index.core.llms import ChatMessage, MessageRole
@@ -45,10 +46,23 @@ class LLMSearchEngine:
             max_tokens=self.max_tokens,
         )
         self.tokenizer = AutoTokenizer.from_pretrained(os.getenv('TOKENIZER_MODEL'))
+        # 文本片段 -> token 数的缓存（如同一 query 前缀）
+        self._encode_len = lru_cache(maxsize=4096)(self._count_tokens)
+        self._chat_overhead_length = None
 
         # 标记为已初始化
         self._initialized = True
 
+    def _count_tokens(self, text: str) -> int:
+        """计算文本片段的token数（不含特殊token，由 _encode_len 缓存）"""
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def get_chat_overhead_length(self) -> int:
+        """聊天模板本身（空的用户消息 + 生成提示）占用的token数，只计算一次"""
+        if self._chat_overhead_length is None:
+            _, self._chat_overhead_length = self.calculate_prompt_length("")
+        return self._chat_overhead_length
+
     def calculate_prompt_length(self, prompt: str) -> Tuple[str, int]:
         """计算提示词的token长度（通用方法）"""
         messages = [{"role": "user", "content": prompt}]
@@ -90,6 +104,29 @@ class LLMSearchEngine:
         token_length = len(self.tokenizer.encode(prompt_str))
         return prompt_str, token_length
 
+    def calculate_item_lengths(
+            self,
+            query: str,
+            items: List[Dict[str, Any]],
+            placeholder_mapping: Dict[str, str]
+    ) -> List[int]:
+        """
+        批量计算各item的token长度，结果与逐条调用 calculate_item_length 近似（分段分词，边界处可能相差个别token）。
+        聊天模板开销和query部分只计算一次；各item字段内容的JSON去重后通过一次 tokenizer 批量调用分词。
+        """
+        if not items:
+            return []
+        fixed_length = self.get_chat_overhead_length() + self._encode_len(f"- query: {query}\n- item: ")
+        item_fields = {k: v for k, v in placeholder_mapping.items() if v != "query"}
+        texts = [
+            json.dumps({k: item[v] for k, v in item_fields.items()}, ensure_ascii=False)
+            for item in items
+        ]
+        unique_texts = list(dict.fromkeys(texts))
+        encoded = self.tokenizer(unique_texts, add_special_tokens=False)
+        text_lengths = {text: len(ids) for text, ids in zip(unique_texts, encoded["input_ids"])}
+        return [fixed_length + text_lengths[text] for text in texts]
+
     def calculate_item_group_length(
             self,
             item_group: List[Dict[str, Any]],
@@ -113,30 +150,35 @@ class LLMSearchEngine:
         lengths: List[int],
         max_remaining_length: int
     ) -> List[List[Dict[str, Any]]]:
-        """根据最大剩余长度对items进行分批（通用方法）"""
-        batches = []
-        current_batch = []
-        current_total = 0
+        """
+        根据最大剩余长度对items进行分批（通用方法）。
+        采用首次适应递减（FFD）装箱：按长度从大到小依次放入第一个容量足够的批次，放不下时新开批次，
+        比按输入顺序依次装填产生的批次（即LLM调用次数）更少。
+        超过最大剩余长度的item单独成批；批次内及批次之间仍保持items的原始顺序。
+        """
+        batch_indices: List[List[int]] = []
+        remaining: List[int] = []
 
-        for item, length in zip(items, lengths):
+        for idx in sorted(range(len(items)), key=lambda i: lengths[i], reverse=True):
+            length = lengths[idx]
             if length > max_remaining_length:
-                if current_batch:
-                    batches.append(current_batch)
-                    current_batch = []
-                    current_total = 0
-                batches.append([item])
+                batch_indices.append([idx])
+                remaining.append(0)
+                continue
+            for batch_idx, capacity in enumerate(remaining):
+                if capacity >= length:
+                    batch_indices[batch_idx].append(idx)
+                    remaining[batch_idx] -= length
+                    break
             else:
-                if current_total + length > max_remaining_length:
-                    batches.append(current_batch)
-                    current_batch = [item]
-                    current_total = length
-                else:
-                    current_batch.append(item)
-                    current_total += length
-
-        if current_batch:
-            batches.append(current_batch)
-        return batches
+                batch_indices.append([idx])
+                remaining.append(max_remaining_length - length)
+
+        # 恢复原始顺序：批次内按原始下标排序，批次按其第一个item的原始下标排序
+        for indices in batch_indices:
+            indices.sort()
+        batch_indices.sort(key=lambda indices: indices[0])
+        return [[items[i] for i in indices] for indices in batch_indices]
 
     def prepare_batch_messages(
             self,
@@ -192,11 +234,8 @@ class LLMSearchEngine:
         if max_remaining_length <= 0:
             raise ValueError(f"模板长度超过最大允许长度（{template_length} > {max_prompt_length}）")
 
-        # 2. 计算每个item的长度（结合query和占位符映射）
-        item_lengths = []
-        for item in items:
-            _, length = self.calculate_item_length(query, item, placeholder_mapping)
-            item_lengths.append(length)
+        # 2. 计算每个item的长度（结合query和占位符映射，公共部分只计算一次）
+        item_lengths = self.calculate_item_lengths(query, items, placeholder_mapping)
 
         # 3. 分批
         batches = self.create_batches_by_length(items, item_lengths, max_remaining_length)